@@ -1,15 +1,50 @@
 #!/usr/bin/env python3
 
 import sys
-from struct import unpack, iter_unpack
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from struct import calcsize, unpack, iter_unpack, error as struct_error
 from datetime import datetime
+from functools import lru_cache
+from hashlib import sha256
 
 
 verbose = False
 
 
-def _verify_checksum(data, checksum):
-    pass
+def _calc_checksum(data):
+    '''Sum the table as big-endian uint32s, zero-padding the final word'''
+    words = array('I')
+    words.frombytes(data[:len(data) - len(data) % 4])
+    if len(data) % 4:
+        words.frombytes(bytes(data[len(data) - len(data) % 4:]).ljust(4, b'\0'))
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return sum(words) & 0xFFFFFFFF
+
+
+def _verify_checksum(tag, data, checksum):
+    if tag == b'head' and len(data) >= 12:
+        # checkSumAdjustment is taken as zero when summing the head table
+        data = bytes(data[:8]) + bytes(4) + bytes(data[12:])
+    return _calc_checksum(data) == checksum
+
+
+def _read_table_directory(f):
+    '''Read the offset table and table directory from the start of a font
+
+    Returns a list of (tag, checksum, offset, length) tuples, in directory
+    order.
+
+    '''
+    (scaler_type, num_tables, search_range, entry_selector,
+            range_shift) = unpack('>IHHHH', f.read(12))
+    tables = []
+    for _ in range(num_tables):
+        tables.append(unpack('>4sIII', f.read(16)))
+    return tables
 
 
 _handlers = {}
@@ -21,10 +56,298 @@ def handles(tag):
         return func
     return real_handles
 
+_parsers = {}
+def parses(tag):
+    def real_parses(func):
+        _parsers[tag] = func
+        return func
+    return real_parses
+
+
+def _print_list(items, end='\n', chunk_size=1024):
+    '''Print items as a list would be printed, without building the list
+
+    Items are consumed and written a chunk at a time, so a long table can be
+    dumped in constant memory.
+
+    '''
+    items = iter(items)
+    separator = '['
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        print(separator + ', '.join(map(repr, chunk)), end='')
+        separator = ', '
+    if separator == '[':
+        print(separator, end='')
+    print(']', end=end)
+
 #
 # Required tables for TrueType fonts
 #
 
+def _cmap_format_4_segments(data, offset, seg_count_x2):
+    '''Generate (start, end, delta, range_offset) for each format 4 segment
+
+    offset points just past the segCountX2..rangeShift header.
+
+    '''
+    view = memoryview(data)
+    end_code = iter_unpack('>H', view[offset:offset+seg_count_x2])
+    offset += seg_count_x2 + 2
+    start_code = iter_unpack('>H', view[offset:offset+seg_count_x2])
+    offset += seg_count_x2
+    id_delta = iter_unpack('>h', view[offset:offset+seg_count_x2])
+    offset += seg_count_x2
+    id_range_offset = iter_unpack('>H', view[offset:offset+seg_count_x2])
+    for (end,), (start,), (delta,), (range_offset,) in zip(
+            end_code, start_code, id_delta, id_range_offset):
+        yield (start, end, delta, range_offset)
+
+def _cmap_add_range(ranges, start, end, glyph, step):
+    '''Append a range to a decoded cmap, merging it with the previous range
+
+    Code points start..end map to glyph, glyph+step, glyph+2*step, ...; step
+    is 1 for most formats and 0 for the many-to-one groups of format 13.
+
+    '''
+    (starts, ends, glyphs, steps) = ranges
+    if (starts and ends[-1] + 1 == start and steps[-1] == step
+            and glyphs[-1] + step*(ends[-1] - starts[-1] + 1) == glyph):
+        ends[-1] = end
+    else:
+        starts.append(start)
+        ends.append(end)
+        glyphs.append(glyph)
+        steps.append(step)
+
+def _cmap_add_glyph(ranges, code_point, glyph, delta=0):
+    if glyph != 0:
+        glyph = (glyph + delta) % 0x10000
+        if glyph != 0:
+            _cmap_add_range(ranges, code_point, code_point, glyph, 1)
+
+def _cmap_decode_ranges(data, offset, format_):
+    '''Decode a format 0-13 subtable into sorted ranges
+
+    The ranges are four parallel arrays (starts, ends, glyphs, steps), see
+    _cmap_add_range.  Code points mapping to glyph 0 are left out.
+
+    '''
+    ranges = (array('I'), array('I'), array('I'), array('B'))
+
+    if format_ == 0:
+        for code_point in range(256):
+            _cmap_add_glyph(ranges, code_point, data[offset+6+code_point])
+    elif format_ == 2:
+        sub_header_keys = unpack('>256H', data[offset+6:offset+518])
+        for high_byte, key in enumerate(sub_header_keys):
+            sub_header = offset + 518 + key
+            (first_code, entry_count, id_delta, id_range_offset) = unpack(
+                    '>2HhH', data[sub_header:sub_header+8])
+            glyph_offset = sub_header + 6 + id_range_offset
+            if key == 0:
+                # Sub-header 0 maps the single-byte codes
+                if first_code <= high_byte < first_code + entry_count:
+                    glyph_offset += (high_byte - first_code) * 2
+                    (glyph,) = unpack('>H', data[glyph_offset:glyph_offset+2])
+                    _cmap_add_glyph(ranges, high_byte, glyph, id_delta)
+                continue
+            glyph_ids = iter_unpack('>H',
+                    memoryview(data)[glyph_offset:glyph_offset+entry_count*2])
+            for low_byte, (glyph,) in enumerate(glyph_ids, first_code):
+                _cmap_add_glyph(ranges, high_byte << 8 | low_byte,
+                        glyph, id_delta)
+    elif format_ == 4:
+        (seg_count_x2,) = unpack('>H', data[offset+6:offset+8])
+        range_offset_base = offset + 16 + seg_count_x2*3
+        for i, (start, end, delta, range_offset) in enumerate(
+                _cmap_format_4_segments(data, offset+14, seg_count_x2)):
+            if range_offset == 0:
+                glyph = (start + delta) % 0x10000
+                while start <= end:
+                    if glyph == 0:
+                        # Skip the code point that wraps around to glyph 0
+                        (start, glyph) = (start + 1, 1)
+                        continue
+                    run_end = min(end, start + 0xFFFF - glyph)
+                    _cmap_add_range(ranges, start, run_end, glyph, 1)
+                    (start, glyph) = (run_end + 1, 0)
+            else:
+                glyph_offset = range_offset_base + i*2 + range_offset
+                glyph_ids = iter_unpack('>H', memoryview(data)[
+                        glyph_offset:glyph_offset+(end-start+1)*2])
+                for code_point, (glyph,) in enumerate(glyph_ids, start):
+                    _cmap_add_glyph(ranges, code_point, glyph, delta)
+    elif format_ in {6, 10}:
+        if format_ == 6:
+            (first_code, entry_count) = unpack('>2H', data[offset+6:offset+10])
+            offset += 10
+        else:
+            (first_code, entry_count) = unpack('>2I', data[offset+12:offset+20])
+            offset += 20
+        glyph_ids = iter_unpack('>H', memoryview(data)[offset:offset+entry_count*2])
+        for code_point, (glyph,) in enumerate(glyph_ids, first_code):
+            _cmap_add_glyph(ranges, code_point, glyph)
+    elif format_ in {8, 12, 13}:
+        if format_ == 8:
+            # Skip the 8192-byte is32 bitmap
+            offset += 8192
+        (num_groups,) = unpack('>I', data[offset+12:offset+16])
+        step = 0 if format_ == 13 else 1
+        for start, end, glyph in iter_unpack('>3I',
+                memoryview(data)[offset+16:offset+16+num_groups*12]):
+            if glyph == 0 and step:
+                (start, glyph) = (start + 1, 1)
+            if glyph != 0 and start <= end:
+                _cmap_add_range(ranges, start, end, glyph, step)
+
+    (starts, ends, glyphs, steps) = ranges
+    if any(starts[i] <= ends[i-1] for i in range(1, len(starts))):
+        # Out of order in the font; fall back to sorting the ranges
+        ordered = sorted(zip(*ranges))
+        ranges = (array('I', (x[0] for x in ordered)),
+                  array('I', (x[1] for x in ordered)),
+                  array('I', (x[2] for x in ordered)),
+                  array('B', (x[3] for x in ordered)))
+    return ranges
+
+def _cmap_decode_variations(data, offset):
+    '''Decode a format 14 subtable into sorted variation selector records
+
+    Returns (selectors, defaults, non_defaults): for the selector at index
+    i, defaults[i] is a (starts, ends) pair of arrays covering the default
+    UVS ranges, and non_defaults[i] a (code_points, glyphs) pair of arrays
+    holding the non-default UVS mappings.
+
+    '''
+    (num_records,) = unpack('>I', data[offset+6:offset+10])
+    selectors = array('I')
+    defaults = []
+    non_defaults = []
+    for record in range(offset+10, offset+10+num_records*11, 11):
+        selectors.append(int.from_bytes(data[record:record+3], 'big'))
+        (default_offset, non_default_offset) = unpack('>2I',
+                data[record+3:record+11])
+
+        starts, ends = array('I'), array('I')
+        if default_offset:
+            table = offset + default_offset
+            (count,) = unpack('>I', data[table:table+4])
+            for (value,) in iter_unpack('>I',
+                    memoryview(data)[table+4:table+4+count*4]):
+                starts.append(value >> 8)
+                ends.append((value >> 8) + (value & 0xFF))
+        defaults.append((starts, ends))
+
+        code_points, glyphs = array('I'), array('H')
+        if non_default_offset:
+            table = offset + non_default_offset
+            (count,) = unpack('>I', data[table:table+4])
+            for mapping in range(table+4, table+4+count*5, 5):
+                code_points.append(int.from_bytes(data[mapping:mapping+3], 'big'))
+                (glyph,) = unpack('>H', data[mapping+3:mapping+5])
+                glyphs.append(glyph)
+        non_defaults.append((code_points, glyphs))
+    return (selectors, defaults, non_defaults)
+
+def _cmap_decode(data):
+    '''Decode every encoding subtable of a cmap table
+
+    Returns {(platform_id, platform_specific_id): (format, mapping)}, where
+    mapping is the ranges of _cmap_decode_ranges, the variation records of
+    _cmap_decode_variations for format 14, or None for an unknown format.
+    Encodings sharing an offset share a single decoded subtable.
+
+    '''
+    (version, num_tables) = unpack('>HH', data[:4])
+    decoded = {}
+    subtables = {}
+    for (platform_id, platform_specific_id, offset) in iter_unpack('>2HI',
+            data[4:4+num_tables*8]):
+        if offset not in decoded:
+            (format_,) = unpack('>H', data[offset:offset+2])
+            if format_ == 14:
+                decoded[offset] = (format_, _cmap_decode_variations(data, offset))
+            elif format_ in {0, 2, 4, 6, 8, 10, 12, 13}:
+                decoded[offset] = (format_, _cmap_decode_ranges(data, offset, format_))
+            else:
+                decoded[offset] = (format_, None)
+        subtables[(platform_id, platform_specific_id)] = decoded[offset]
+    return subtables
+
+def _cmap_unicode(subtables):
+    '''Pick the best Unicode ranges and variation records from a decoded cmap
+
+    Full-repertoire subtables are preferred over BMP-only ones.  Either
+    result is None if the font has no such subtable.
+
+    '''
+    ranges = None
+    for encoding in ((3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1),
+            (0, 0), (1, 0)):
+        if encoding in subtables and subtables[encoding][0] not in {13, 14}:
+            ranges = subtables[encoding][1]
+            if ranges is not None:
+                break
+    variations = None
+    if (0, 5) in subtables and subtables[(0, 5)][0] == 14:
+        variations = subtables[(0, 5)][1]
+    return (ranges, variations)
+
+def _cmap_lookup(ranges, code_point):
+    '''Look up the glyph for a code point in decoded ranges, 0 if unmapped'''
+    (starts, ends, glyphs, steps) = ranges
+    i = bisect_right(starts, code_point) - 1
+    if i < 0 or code_point > ends[i]:
+        return 0
+    return glyphs[i] + steps[i]*(code_point - starts[i])
+
+def _cmap_variation_lookup(variations, code_point, selector):
+    '''Look up a variation sequence in decoded format 14 records
+
+    Returns the glyph for a non-default mapping, None if the sequence maps
+    to the code point's default glyph, and 0 if the sequence is not listed.
+
+    '''
+    (selectors, defaults, non_defaults) = variations
+    i = bisect_left(selectors, selector)
+    if i == len(selectors) or selectors[i] != selector:
+        return 0
+    (code_points, glyphs) = non_defaults[i]
+    j = bisect_left(code_points, code_point)
+    if j < len(code_points) and code_points[j] == code_point:
+        return glyphs[j]
+    (starts, ends) = defaults[i]
+    j = bisect_right(starts, code_point) - 1
+    if j >= 0 and code_point <= ends[j]:
+        return None
+    return 0
+
+def _is_variation_selector(code_point):
+    return 0xFE00 <= code_point <= 0xFE0F or 0xE0100 <= code_point <= 0xE01EF
+
+def _cmap_glyphs(ranges, variations, text):
+    '''Generate the glyph IDs for a string, honouring variation sequences
+
+    Variation selectors are consumed with the character they follow and do
+    not produce a glyph of their own.
+
+    '''
+    code_points = [ord(char) for char in text]
+    for i, code_point in enumerate(code_points):
+        if _is_variation_selector(code_point) and i > 0:
+            continue
+        glyph = None
+        if (variations is not None and i + 1 < len(code_points)
+                and _is_variation_selector(code_points[i+1])):
+            glyph = _cmap_variation_lookup(variations, code_point,
+                                           code_points[i+1]) or None
+        if glyph is None:
+            glyph = _cmap_lookup(ranges, code_point) if ranges else 0
+        yield glyph
+
 @handles(b'cmap')
 def _cmap_handler(tag, data):
     '''Handler for the Character To Glyph Index Mapping Table
@@ -40,6 +363,7 @@ def _cmap_handler(tag, data):
     print(f'    Number of Encoding Tables: {num_tables}')
 
     table_offset = 4
+    shared = {}
     for _ in range(num_tables):
         (platform_id, platform_specific_id, offset) = unpack('>2HI',
                 data[table_offset:table_offset+8])
@@ -47,6 +371,12 @@ def _cmap_handler(tag, data):
 
         print(f'    Encoding ({platform_id}, {platform_specific_id}):')
 
+        if offset in shared:
+            print(f'        Same subtable as Encoding {shared[offset]}')
+            continue
+        shared[offset] = (platform_id, platform_specific_id)
+        subtable_offset = offset
+
         (format_,) = unpack('>H', data[offset:offset+2])
 
         if format_ in {0, 2, 4, 6}:
@@ -79,26 +409,15 @@ def _cmap_handler(tag, data):
             (seg_count_x2, search_range, entry_selector,
                     range_shift) = unpack('>4H', data[offset:offset+8])
             offset += 8
-
-            end_code = iter_unpack('>H', data[offset:offset+seg_count_x2])
-            end_code = [x for (x,) in end_code]
-            offset += seg_count_x2 + 2
-            start_code = iter_unpack('>H', data[offset:offset+seg_count_x2])
-            start_code = [x for (x,) in start_code]
-            offset += seg_count_x2
-            id_delta = iter_unpack('>h', data[offset:offset+seg_count_x2])
-            id_delta = [x for (x,) in id_delta]
-            offset += seg_count_x2
-            id_range_offset = iter_unpack('>H', data[offset:offset+seg_count_x2])
-            id_range_offset = [x for (x,) in id_range_offset]
+            segments = _cmap_format_4_segments(data, offset, seg_count_x2)
+            offset += seg_count_x2 * 3 + 2
 
             print(' '*12 + f'Segment Count \xd7 2: {seg_count_x2}')
             print(' '*12 + f'Search Range: {search_range}')
             print(' '*12 + f'Entry Selector: {entry_selector}')
             print(' '*12 + f'Range Shift: {range_shift}')
             print(' '*12 + f'List of (Start Code, End Code, Index Delta, Index Range Offset):')
-            for i, (start, end, delta, range_offset) in enumerate(zip(
-                    start_code, end_code, id_delta, id_range_offset)):
+            for i, (start, end, delta, range_offset) in enumerate(segments):
                 if not verbose and i >= 12:
                     print(' '*16 + '...')
                     print(' '*16 + '[Use -v to see the full table]')
@@ -116,9 +435,11 @@ def _cmap_handler(tag, data):
                 else:
                     range_offset += offset + i*2
                     range_size = (end - start + 1) * 2
-                    range_ = iter_unpack('>H', data[range_offset:range_offset+range_size])
-                    range_ = [x+delta if x!=0 else 0 for (x,) in range_]
-                    print(f' [{start}..{end} => {range_}]')
+                    range_ = iter_unpack('>H',
+                            memoryview(data)[range_offset:range_offset+range_size])
+                    print(f' [{start}..{end} => ', end='')
+                    _print_list((x+delta if x!=0 else 0 for (x,) in range_),
+                                end=']\n')
         elif format_ == 6:
             (first_code, entry_count) = unpack('>2H', data[offset:offset+4])
             offset += 4
@@ -154,8 +475,55 @@ def _cmap_handler(tag, data):
                     end_glyph = end + start_glyph - start
                     print(f' [{start}..{end} => {start_glyph}..{end_glyph}]')
 
+        elif format_ == 14:
+            (selectors, defaults, non_defaults) = _cmap_decode_variations(
+                    data, subtable_offset)
+
+            print(' '*12 + f'Number of Variation Selector Records: {len(selectors)}')
+            for selector, (starts, ends), (code_points, glyphs) in zip(
+                    selectors, defaults, non_defaults):
+                print(' '*12 + f'Variation Selector U+{selector:04X}:')
+                print(' '*16 + f'Default UVS Ranges: {len(starts)}')
+                for i, (start, end) in enumerate(zip(starts, ends)):
+                    if not verbose and i >= 12:
+                        print(' '*20 + '...')
+                        print(' '*20 + '[Use -v to see the full table]')
+                        print(' '*20 + '...')
+                        break
+
+                    print(' '*20 + f'U+{start:04X}..U+{end:04X}')
+                print(' '*16 + f'Non-Default UVS Mappings: {len(code_points)}')
+                for i, (code_point, glyph_id) in enumerate(zip(code_points, glyphs)):
+                    if not verbose and i >= 12:
+                        print(' '*20 + '...')
+                        print(' '*20 + '[Use -v to see the full table]')
+                        print(' '*20 + '...')
+                        break
+
+                    print(' '*20 + f'U+{code_point:04X} => {glyph_id}')
+
         else:
-            print(' '*12 + '...')
+            (starts, ends, glyphs, steps) = _cmap_decode_ranges(
+                    data, subtable_offset, format_)
+
+            print(' '*12 + f'Number of Ranges: {len(starts)}')
+            print(' '*12 + f'List of (Start Code, End Code, Start Glyph):')
+            for i, (start, end, start_glyph, step) in enumerate(zip(
+                    starts, ends, glyphs, steps)):
+                if not verbose and i >= 12:
+                    print(' '*16 + '...')
+                    print(' '*16 + '[Use -v to see the full table]')
+                    print(' '*16 + '...')
+                    break
+
+                print(' '*16 + f'({start},{end},{start_glyph})', end='')
+                if start == end:
+                    print(f' [{start} => {start_glyph}]')
+                elif step == 0:
+                    print(f' [{start}..{end} => {start_glyph}]')
+                else:
+                    end_glyph = start_glyph + end - start
+                    print(f' [{start}..{end} => {start_glyph}..{end_glyph}]')
 
 @handles(b'glyf')
 def _glyf_handler(tag, data):
@@ -171,38 +539,43 @@ def _head_handler(tag, data):
     '''
     print('Global Font Information Header Table [head]:')
 
-    (version, font_revision,
-        checksum_adjustment, magic_number, flags,
-        units_per_em, created, modified,
-        x_min, y_min, x_max, y_max,
-        mac_style, lowest_rec_ppem, font_direction_hint,
-        index_to_loc_format, glyph_data_format) = unpack(
-                '>2i2I2H2q4h2H3h', data)
+    head = _head_parser(data)
     # Convert times from seconds since 1904 Jan 01
     try:
-        created_datetime = datetime.fromtimestamp(created - 2082844800)
+        created_datetime = datetime.fromtimestamp(head['created'] - 2082844800)
     except (ValueError, OSError):
         created_datetime = 'Out of range'
     try:
-        modified_datetime = datetime.fromtimestamp(modified - 2082844800)
+        modified_datetime = datetime.fromtimestamp(head['modified'] - 2082844800)
     except (ValueError, OSError):
         modified_datetime = 'Out of range'
 
-    print(f'    Version: {round(version/0x10000,5)}')
-    print(f'    Font Revision: {round(font_revision/0x10000,5)}')
-    print(f'    Checksum Adjustment: 0x{checksum_adjustment:08X}')
-    print(f'    Magic Number: 0x{magic_number:08X}')
-    print(f'    Flags: 0x{flags:04X}')
-    print(f'    Units Per Em: {units_per_em}')
-    print(f'    Time Created: {created} [{created_datetime}]')
-    print(f'    Time Modified: {modified} [{modified_datetime}]')
-    print(f'    Min/Max x: {x_min} {x_max}')
-    print(f'    Min/Max y: {y_min} {y_max}')
-    print(f'    Mac Style: 0x{mac_style:04X}')
-    print(f'    Smallest Readable Size in Pixels: {lowest_rec_ppem}')
-    print(f'    Font Direction Hint: {font_direction_hint}')
-    print(f'    Index to Loc Format: {index_to_loc_format}')
-    print(f'    Glyph Data Format: {glyph_data_format}')
+    print(f'    Version: {round(head["version"]/0x10000,5)}')
+    print(f'    Font Revision: {round(head["font_revision"]/0x10000,5)}')
+    print(f'    Checksum Adjustment: 0x{head["checksum_adjustment"]:08X}')
+    print(f'    Magic Number: 0x{head["magic_number"]:08X}')
+    print(f'    Flags: 0x{head["flags"]:04X}')
+    print(f'    Units Per Em: {head["units_per_em"]}')
+    print(f'    Time Created: {head["created"]} [{created_datetime}]')
+    print(f'    Time Modified: {head["modified"]} [{modified_datetime}]')
+    print(f'    Min/Max x: {head["x_min"]} {head["x_max"]}')
+    print(f'    Min/Max y: {head["y_min"]} {head["y_max"]}')
+    print(f'    Mac Style: 0x{head["mac_style"]:04X}')
+    print(f'    Smallest Readable Size in Pixels: {head["lowest_rec_ppem"]}')
+    print(f'    Font Direction Hint: {head["font_direction_hint"]}')
+    print(f'    Index to Loc Format: {head["index_to_loc_format"]}')
+    print(f'    Glyph Data Format: {head["glyph_data_format"]}')
+
+@parses(b'head')
+def _head_parser(data):
+    '''Parse the Global Font Information Header Table into a record'''
+    fields = ('version', 'font_revision',
+        'checksum_adjustment', 'magic_number', 'flags',
+        'units_per_em', 'created', 'modified',
+        'x_min', 'y_min', 'x_max', 'y_max',
+        'mac_style', 'lowest_rec_ppem', 'font_direction_hint',
+        'index_to_loc_format', 'glyph_data_format')
+    return dict(zip(fields, unpack('>2i2I2H2q4h2H3h', data[:54])))
 
 @handles(b'hhea')
 def _hhea_handler(tag, data):
@@ -214,24 +587,29 @@ def _hhea_handler(tag, data):
     '''
     print('Horizontal Header Layout Table [hhea]:')
 
-    (version, ascender, descender, line_gap,
-        advance_width_max, min_left_side_bearing, min_right_side_bearing,
-        x_max_extent, caret_slope_rise, caret_slope_run, caret_offset,
-        metric_data_format, number_of_h_metrics) = unpack(
-                '>i3hH6h8xhH', data)
-
-    print(f'    Version: {round(version/0x10000,5)}')
-    print(f'    Ascender: {ascender}')
-    print(f'    Descender: {descender}')
-    print(f'    Line Gap: {line_gap}')
-    print(f'    Maximum Advance Width: {advance_width_max}')
-    print(f'    Minimum Left Side Bearing: {min_left_side_bearing}')
-    print(f'    Minimum Right Side Bearing: {min_right_side_bearing}')
-    print(f'    Maximum x Extent: {x_max_extent}')
-    print(f'    Caret Slope Rise/Run: {caret_slope_rise} {caret_slope_run}')
-    print(f'    Caret Offset: {caret_offset}')
-    print(f'    Metric Data Format: {metric_data_format}')
-    print(f'    Number of hMetric entries in \'hmtx\' table: {number_of_h_metrics}')
+    hhea = _hhea_parser(data)
+
+    print(f'    Version: {round(hhea["version"]/0x10000,5)}')
+    print(f'    Ascender: {hhea["ascender"]}')
+    print(f'    Descender: {hhea["descender"]}')
+    print(f'    Line Gap: {hhea["line_gap"]}')
+    print(f'    Maximum Advance Width: {hhea["advance_width_max"]}')
+    print(f'    Minimum Left Side Bearing: {hhea["min_left_side_bearing"]}')
+    print(f'    Minimum Right Side Bearing: {hhea["min_right_side_bearing"]}')
+    print(f'    Maximum x Extent: {hhea["x_max_extent"]}')
+    print(f'    Caret Slope Rise/Run: {hhea["caret_slope_rise"]} {hhea["caret_slope_run"]}')
+    print(f'    Caret Offset: {hhea["caret_offset"]}')
+    print(f'    Metric Data Format: {hhea["metric_data_format"]}')
+    print(f'    Number of hMetric entries in \'hmtx\' table: {hhea["number_of_h_metrics"]}')
+
+@parses(b'hhea')
+def _hhea_parser(data):
+    '''Parse the Horizontal Header Layout Table into a record'''
+    fields = ('version', 'ascender', 'descender', 'line_gap',
+        'advance_width_max', 'min_left_side_bearing', 'min_right_side_bearing',
+        'x_max_extent', 'caret_slope_rise', 'caret_slope_run', 'caret_offset',
+        'metric_data_format', 'number_of_h_metrics')
+    return dict(zip(fields, unpack('>i3hH6h8xhH', data[:36])))
 
 @handles(b'hmtx')
 def _hmtx_handler(tag, data):
@@ -251,29 +629,114 @@ def _maxp_handler(tag, data):
     '''
     print('Maximum Profile Table [maxp]:')
 
+    maxp = _maxp_parser(data)
+
+    print(f'    Version: {round(maxp["version"]/0x10000,5)}')
+    print(f'    Number of Glyphs: {maxp["num_glyphs"]}')
+
+    if maxp['version'] >= 0x10000:
+        print(f'    Maximum Points in Non-Composite Glyph: {maxp["max_points"]}')
+        print(f'    Maximum Contours in Non-Composite Glyph: {maxp["max_contours"]}')
+        print(f'    Maximum Points in Composite Glyph: {maxp["max_composite_points"]}')
+        print(f'    Maximum Contours in Composite Glyph: {maxp["max_composite_contours"]}')
+        print(f'    Maximum Zones Used: {maxp["max_zones"]}')
+        print(f'    Maximum Points Used in Z0: {maxp["max_twilight_points"]}')
+        print(f'    Number of Storage Area locations: {maxp["max_storage"]}')
+        print(f'    Number of FDEFs: {maxp["max_function_defs"]}')
+        print(f'    Number of IDEFs: {maxp["max_instruction_defs"]}')
+        print(f'    Maximum Stack Depth: {maxp["max_stack_elements"]}')
+        print(f'    Maximum Glyph Instruction Byte Count: {maxp["max_size_of_instructions"]}')
+        print(f'    Maximum Top Level Components: {maxp["max_component_elements"]}')
+        print(f'    Maximum Recursion Levels: {maxp["max_component_depth"]}')
+
+@parses(b'maxp')
+def _maxp_parser(data):
+    '''Parse the Maximum Profile Table into a record'''
     (version, num_glyphs) = unpack('>iH', data[:6])
+    record = {'version': version, 'num_glyphs': num_glyphs}
+    if version >= 0x10000:
+        fields = ('max_points', 'max_contours',
+            'max_composite_points', 'max_composite_contours',
+            'max_zones', 'max_twilight_points', 'max_storage',
+            'max_function_defs', 'max_instruction_defs', 'max_stack_elements',
+            'max_size_of_instructions', 'max_component_elements',
+            'max_component_depth')
+        record.update(zip(fields, unpack('>13H', data[6:32])))
+    return record
+
+_name_id_list = [
+    'Copyright notice',
+    'Font Family name',
+    'Font Subfamily name',
+    'Unique font identifier',
+    'Full font name',
+    'Version string',
+    'PostScript name',
+    'Trademark',
+    'Manufacturer Name',
+    'Designer',
+    'Description',
+    'URL Vendor',
+    'URL Designer',
+    'License Description',
+    'License Info URL',
+    'Reserved(15)',
+    'Typographic Family name',
+    'Typographic Subfamily name',
+    'Compatible Full',
+    'Sample text',
+    'PostScript CID findfont name',
+    'WWS Family Name',
+    'WWS Subfamily Name',
+    'Light Background Palette',
+    'Dark Background Palette',
+    'Variations PostScript Name Prefix',
+]
+
+def _decode_name(platform_id, platform_specific_id, name):
+    encoding = (platform_id, platform_specific_id)
+    try:
+        if encoding in {(0, 0), (0, 3), (3, 0), (3, 1)}:
+            name = name.decode('utf-16-be')
+        elif encoding == (1, 0):
+            name = name.decode('mac_roman')
+        elif encoding == (1, 1):
+            name = name.decode('x_mac_japanese')
+        elif encoding == (1, 3):
+            name = name.decode('x_mac_korean')
+    except UnicodeDecodeError:
+        name = f'[Decode error] {name}'
+    return name
+
+def _name_records(data):
+    '''Generate (key, name) for every name record, then every language tag
+
+    Name records are keyed "(platform,encoding,0xlanguage,name ID)" and
+    language tag records by their 0x8000-based language ID.
 
-    print(f'    Version: {round(version/0x10000,5)}')
-    print(f'    Number of Glyphs: {num_glyphs}')
+    '''
+    (format_, count, string_offset) = unpack('>3H', data[:6])
+    table_offset = 6
+    for _ in range(count):
+        (platform_id, platform_specific_id, language_id, name_id,
+            length, offset) = unpack('>6H', data[table_offset:table_offset+12])
+        table_offset += 12
+        name_offset = string_offset + offset
+        name = data[name_offset:name_offset+length]
+        if name_id < 26:
+            name_id = _name_id_list[name_id]
+        yield (f'({platform_id},{platform_specific_id},'
+                f'0x{language_id:X},{name_id})',
+               _decode_name(platform_id, platform_specific_id, name))
 
-    if version >= 0x10000:
-        (max_points, max_contours, max_composite_points, max_composite_contours,
-            max_zones, max_twilight_points, max_storage, max_function_defs,
-            max_instruction_defs, max_stack_elements, max_size_of_instructions,
-            max_component_elements, max_component_depth) = unpack('>13H', data[6:])
-        print(f'    Maximum Points in Non-Composite Glyph: {max_points}')
-        print(f'    Maximum Contours in Non-Composite Glyph: {max_contours}')
-        print(f'    Maximum Points in Composite Glyph: {max_composite_points}')
-        print(f'    Maximum Contours in Composite Glyph: {max_composite_contours}')
-        print(f'    Maximum Zones Used: {max_zones}')
-        print(f'    Maximum Points Used in Z0: {max_twilight_points}')
-        print(f'    Number of Storage Area locations: {max_storage}')
-        print(f'    Number of FDEFs: {max_function_defs}')
-        print(f'    Number of IDEFs: {max_instruction_defs}')
-        print(f'    Maximum Stack Depth: {max_stack_elements}')
-        print(f'    Maximum Glyph Instruction Byte Count: {max_size_of_instructions}')
-        print(f'    Maximum Top Level Components: {max_component_elements}')
-        print(f'    Maximum Recursion Levels: {max_component_depth}')
+    if format_ == 1:
+        (lang_tag_count,) = unpack('>H', data[table_offset:table_offset+2])
+        table_offset += 2
+        for i in range(lang_tag_count):
+            (length, offset) = unpack('>2H', data[table_offset:table_offset+4])
+            table_offset += 4
+            lang_tag_offset = string_offset + offset
+            yield (f'0x{0x8000+i:X}', data[lang_tag_offset:lang_tag_offset+length])
 
 @handles(b'name')
 def _name_handler(tag, data):
@@ -285,81 +748,52 @@ def _name_handler(tag, data):
     '''
     print('Naming Table [name]:')
 
-    name_id_list = [
-        'Copyright notice',
-        'Font Family name',
-        'Font Subfamily name',
-        'Unique font identifier',
-        'Full font name',
-        'Version string',
-        'PostScript name',
-        'Trademark',
-        'Manufacturer Name',
-        'Designer',
-        'Description',
-        'URL Vendor',
-        'URL Designer',
-        'License Description',
-        'License Info URL',
-        'Reserved(15)',
-        'Typographic Family name',
-        'Typographic Subfamily name',
-        'Compatible Full',
-        'Sample text',
-        'PostScript CID findfont name',
-        'WWS Family Name',
-        'WWS Subfamily Name',
-        'Light Background Palette',
-        'Dark Background Palette',
-        'Variations PostScript Name Prefix',
-    ]
-
-    (format_, count, string_offset) = unpack('>3H', data[:6])
+    (format_, count) = unpack('>2H', data[:4])
 
     print(f'    Format: {format_}')
     print(f'    Number of Name Records: {count}')
     print('    Name Records:')
 
-    table_offset = 6
-    for _ in range(count):
-        (platform_id, platform_specific_id, language_id, name_id,
-            length, offset) = unpack('>6H', data[table_offset:table_offset+12])
-        table_offset += 12
-        name_offset = string_offset + offset
-        name = data[name_offset:name_offset+length]
-        if name_id < 26:
-            name_id = name_id_list[name_id]
-
-        encoding = (platform_id, platform_specific_id)
-        try:
-            if encoding in {(0, 0), (0, 3), (3, 0), (3, 1)}:
-                name = name.decode('utf-16-be')
-            elif encoding == (1, 0):
-                name = name.decode('mac_roman')
-            elif encoding == (1, 1):
-                name = name.decode('x_mac_japanese')
-            elif encoding == (1, 3):
-                name = name.decode('x_mac_korean')
-        except UnicodeDecodeError:
-            name = f'[Decode error] {name}'
-
-        print(f'        ({platform_id},{platform_specific_id},'
-                       f'0x{language_id:X},{name_id}): {name}')
+    records = _name_records(data)
+    for key, name in islice(records, count):
+        print(f'        {key}: {name}')
 
     if format_ == 1:
-        (lang_tag_count,) = unpack('>H', data[table_offset:table_offset+2])
+        (lang_tag_count,) = unpack('>H', data[6+count*12:8+count*12])
 
         print(f'    Number of Language Tag Records: {lang_tag_count}')
         print('    Language Tag Records:')
 
-        table_offset += 2
-        for i in range(lang_tag_count):
-            (length, offset) = unpack('>2H', data[table_offset:table_offset+4])
-            table_offset += 4
-            lang_tag_offset = string_offset + offset
-            lang_tag = data[lang_tag_offset:lang_tag_offset+length]
+        for key, lang_tag in records:
+            print(f'        {key}: {lang_tag}')
+
+@parses(b'name')
+def _name_parser(data):
+    '''Parse the Naming Table into a record keyed by name record'''
+    (format_,) = unpack('>H', data[:2])
+    record = {'format': format_}
+    record.update(_name_records(data))
+    return record
 
-            print(f'        0x{0x8000+i:X}: {lang_tag}')
+def _post_glyph_names(data, offset, num_glyphs):
+    '''Generate the glyph names of a version 2.0 post table, in glyph order
+
+    offset points at the glyphNameIndex array.  Standard Macintosh names are
+    generated as their index; custom names as the Pascal string bytes.  Only
+    the offsets of the custom names are kept, not the names themselves.
+
+    '''
+    name_offsets = array('I')
+    name_offset = offset + num_glyphs*2
+    while name_offset < len(data):
+        name_offsets.append(name_offset)
+        name_offset += data[name_offset] + 1
+    for (x,) in iter_unpack('>H', memoryview(data)[offset:offset+num_glyphs*2]):
+        if x < 258:
+            yield x
+        else:
+            name_offset = name_offsets[x-258]
+            yield data[name_offset+1:name_offset+1+data[name_offset]]
 
 @handles(b'post')
 def _post_handler(tag, data):
@@ -371,38 +805,28 @@ def _post_handler(tag, data):
     '''
     print('PostScript Table [post]:')
 
-    (version, italic_angle, underline_position, underline_thickness,
-            is_fixed_pitch, min_mem_type_42, max_mem_type_42,
-            min_mem_type_1, max_mem_type_1) = unpack('>2i2h5I', data[:32])
-    offset = 32
+    post = _post_header(data)
+    version = post['version']
 
     print(f'    Version: {round(version/0x10000,5)}')
-    print(f'    Italic Angle: {round(italic_angle/0x10000,5)}')
-    print(f'    Underline Position: {underline_position}')
-    print(f'    Underline Thickness: {underline_thickness}')
-    print(f'    Is Fixed Pitch: {is_fixed_pitch}')
-    print(f'    Minimum Memory for Type 42: {min_mem_type_42}')
-    print(f'    Maximum Memory for Type 42: {max_mem_type_42}')
-    print(f'    Minimum Memory for Type 1: {min_mem_type_1}')
-    print(f'    Maximum Memory for Type 1: {max_mem_type_1}')
+    print(f'    Italic Angle: {round(post["italic_angle"]/0x10000,5)}')
+    print(f'    Underline Position: {post["underline_position"]}')
+    print(f'    Underline Thickness: {post["underline_thickness"]}')
+    print(f'    Is Fixed Pitch: {post["is_fixed_pitch"]}')
+    print(f'    Minimum Memory for Type 42: {post["min_mem_type_42"]}')
+    print(f'    Maximum Memory for Type 42: {post["max_mem_type_42"]}')
+    print(f'    Minimum Memory for Type 1: {post["min_mem_type_1"]}')
+    print(f'    Maximum Memory for Type 1: {post["max_mem_type_1"]}')
 
     if version == 0x10000:
         print(f'    Using standard names table')
     if version == 0x20000:
-        (num_glyphs,) = unpack('>H', data[offset:offset+2])
-        offset += 2
-        glyph_name_index = iter_unpack('>H', data[offset:offset+num_glyphs*2])
-        offset += num_glyphs * 2
-        names = list(range(258))
-        while offset < len(data):
-            name_size = data[offset]
-            names.append(data[offset+1:offset+1+name_size])
-            offset += name_size + 1
-        glyph_name_list = [names[x] for (x,) in glyph_name_index]
+        num_glyphs = post['num_glyphs']
 
         print(f'    Number of Glyphs: {num_glyphs}')
         if num_glyphs <= 96 or verbose:
-            print(f'    Glyph Names: {glyph_name_list}')
+            print('    Glyph Names: ', end='')
+            _print_list(_post_glyph_names(data, 34, num_glyphs))
         else:
             print('    ... [Use -v to see the glyph names list] ...')
     # Microsoft documentation indicates a value of 0x25000 for representing
@@ -414,6 +838,27 @@ def _post_handler(tag, data):
     if version == 0x40000:
         pass
 
+def _post_header(data):
+    '''Parse the PostScript Table header, and the glyph count of version 2.0'''
+    fields = ('version', 'italic_angle',
+        'underline_position', 'underline_thickness',
+        'is_fixed_pitch', 'min_mem_type_42', 'max_mem_type_42',
+        'min_mem_type_1', 'max_mem_type_1')
+    record = dict(zip(fields, unpack('>2i2h5I', data[:32])))
+    if record['version'] == 0x20000:
+        (record['num_glyphs'],) = unpack('>H', data[32:34])
+    return record
+
+@parses(b'post')
+def _post_parser(data):
+    '''Parse the PostScript Table into a record, one field per glyph name'''
+    record = _post_header(data)
+    if record['version'] == 0x20000:
+        for glyph_id, name in enumerate(
+                _post_glyph_names(data, 34, record['num_glyphs'])):
+            record[f'glyph_name[{glyph_id}]'] = name
+    return record
+
 #
 # Optional tables for TrueType fonts
 #
@@ -433,9 +878,51 @@ def _cvt__handler(tag, data):
 def _fpgm_handler(tag, data):
     print(f'{tag} table contains {len(data)} bytes')
 
+def _hdmx_index(data, num_glyphs=None):
+    '''Index the device records of an hdmx table by pixel size
+
+    Returns {ppem: (max_width, widths)}, where widths is the record's
+    uint8 advance width array, indexed by glyph ID.  Given maxp.numGlyphs,
+    the widths stop there rather than running into the record's padding.
+
+    '''
+    (version, num_records, size_device_record) = unpack('>Hhi', data[:8])
+    width_count = size_device_record - 2
+    if num_glyphs is not None:
+        width_count = min(width_count, num_glyphs)
+    records = {}
+    for offset in range(8, 8+num_records*size_device_record, size_device_record):
+        (pixel_size, max_width) = data[offset:offset+2]
+        records[pixel_size] = (max_width,
+                               data[offset+2:offset+2+width_count])
+    return records
+
 @handles(b'hdmx')
 def _hdmx_handler(tag, data):
-    print(f'{tag} table contains {len(data)} bytes')
+    '''Handler for the Horizontal Device Metrics Table
+
+    https://developer.apple.com/fonts/TrueType-Reference-Manual/RM06/Chap6hdmx.html
+    https://docs.microsoft.com/en-us/typography/opentype/spec/hdmx
+
+    '''
+    print('Horizontal Device Metrics Table [hdmx]:')
+
+    (version, num_records, size_device_record) = unpack('>Hhi', data[:8])
+    records = _hdmx_index(data)
+
+    print(f'    Version: {version}')
+    print(f'    Number of Device Records: {num_records}')
+    print(f'    Size of Device Record: {size_device_record}')
+    print('    List of (Pixel Size, Maximum Width):')
+    for pixel_size, (max_width, widths) in records.items():
+        print(' '*8 + f'({pixel_size},{max_width})', end='')
+        if verbose:
+            print(' ', end='')
+            _print_list(widths)
+        else:
+            print()
+    if records and not verbose:
+        print(' '*8 + '[Use -v to see the widths]')
 
 @handles(b'kern')
 def _kern_handler(tag, data):
@@ -455,16 +942,8 @@ def _OS_2_handler(tag, data):
         print(f'WARNING: \'OS/2\' block of {len(data)} bytes, expected at least 68')
         return
 
-    (version, avg_char_width, weight_class, width_class, type_,
-        subscript_x_size, subscript_y_size,
-        subscript_x_offset, subscript_y_offset,
-        superscript_x_size, superscript_y_size,
-        superscript_x_offset, superscript_y_offset,
-        strikeout_size, strikeout_position,
-        family_class, panose,
-        unicode_range_1, unicode_range_2, unicode_range_3, unicode_range_4,
-        vend_id, selection, first_char_index, last_char_index) = unpack(
-                '>Hh2H12h10s4I4s3H', data[:68])
+    os_2 = _OS_2_parser(data)
+    selection = os_2['selection']
     selection_breakout = []
     if selection & 1:
         selection_breakout.append('ITALIC')
@@ -488,60 +967,88 @@ def _OS_2_handler(tag, data):
         selection_breakout.append('OBLIQUE')
     selection_breakout = ' '.join(selection_breakout)
 
-    print(f'    Version: {version}')
-    print(f'    Average Character Width: {avg_char_width}')
-    print(f'    Weight Class: {weight_class}')
-    print(f'    Width Class: {width_class}')
-    print(f'    Type: {type_}')
-    print(f'    Subscript: {subscript_x_size}\xd7{subscript_y_size}'
-                      f' @ {subscript_x_offset},{subscript_y_offset}')
-    print(f'    Superscript: {superscript_x_size}\xd7{superscript_y_size}'
-                      f' @ {superscript_x_offset},{superscript_y_offset}')
-    print(f'    Strikeout: {strikeout_size} @ {strikeout_position}')
-    print(f'    Family Class: {family_class}')
+    print(f'    Version: {os_2["version"]}')
+    print(f'    Average Character Width: {os_2["avg_char_width"]}')
+    print(f'    Weight Class: {os_2["weight_class"]}')
+    print(f'    Width Class: {os_2["width_class"]}')
+    print(f'    Type: {os_2["type_"]}')
+    print(f'    Subscript: {os_2["subscript_x_size"]}\xd7{os_2["subscript_y_size"]}'
+                      f' @ {os_2["subscript_x_offset"]},{os_2["subscript_y_offset"]}')
+    print(f'    Superscript: {os_2["superscript_x_size"]}\xd7{os_2["superscript_y_size"]}'
+                      f' @ {os_2["superscript_x_offset"]},{os_2["superscript_y_offset"]}')
+    print(f'    Strikeout: {os_2["strikeout_size"]} @ {os_2["strikeout_position"]}')
+    print(f'    Family Class: {os_2["family_class"]}')
     print('    Panose: ', end='')
-    print(' '.join([bytes([b]).hex() for b in panose]))
-    print(f'    Unicode Range: {unicode_range_4:08X}:{unicode_range_3:08X}:'
-                             f'{unicode_range_2:08X}:{unicode_range_1:08X}'
+    print(' '.join([bytes([b]).hex() for b in os_2['panose']]))
+    print(f'    Unicode Range: {os_2["unicode_range_4"]:08X}:{os_2["unicode_range_3"]:08X}:'
+                             f'{os_2["unicode_range_2"]:08X}:{os_2["unicode_range_1"]:08X}'
                              ' (bit0 last)')
-    print(f'    Vendor ID: {vend_id}')
+    print(f'    Vendor ID: {os_2["vend_id"]}')
     print(f'    Selection: {selection} [{selection_breakout}]')
-    print(f'    Character Index Range: {first_char_index} to {last_char_index}')
-
-    if len(data) >= 78:
-        (typo_ascender, typo_descender, typo_line_gap,
-            win_ascent, win_descent) = unpack('>3h2H', data[68:78])
-        print(f'    Typographic Ascender: {typo_ascender}')
-        print(f'    Typographic Descender: {typo_descender}')
-        print(f'    Typographic Line Gap: {typo_line_gap}')
-        print(f'    Windows Ascender: {win_ascent}')
-        print(f'    Windows Descender: {win_descent}')
-
-    if version >= 1 and len(data) >= 86:
-        (code_page_range_1, code_page_range_2) = unpack('>2I', data[78:86])
-        print(f'    Code Page Character Range: {code_page_range_2:08X}:'
-                                             f'{code_page_range_1:08X}'
+    print(f'    Character Index Range: {os_2["first_char_index"]} to {os_2["last_char_index"]}')
+
+    if 'typo_ascender' in os_2:
+        print(f'    Typographic Ascender: {os_2["typo_ascender"]}')
+        print(f'    Typographic Descender: {os_2["typo_descender"]}')
+        print(f'    Typographic Line Gap: {os_2["typo_line_gap"]}')
+        print(f'    Windows Ascender: {os_2["win_ascent"]}')
+        print(f'    Windows Descender: {os_2["win_descent"]}')
+
+    if 'code_page_range_1' in os_2:
+        print(f'    Code Page Character Range: {os_2["code_page_range_2"]:08X}:'
+                                             f'{os_2["code_page_range_1"]:08X}'
                                              ' (bit0 last)')
 
-    if version >= 2 and len(data) >= 96:
-        (x_height, cap_height, default_char, break_char,
-            max_context) = unpack('>2h3H', data[86:96])
-        if default_char == 0:
+    if 'x_height' in os_2:
+        if os_2['default_char'] == 0:
             default_char = 'glyph 0'
         else:
-            default_char = f'U+{default_char:04X}'
+            default_char = f'U+{os_2["default_char"]:04X}'
 
-        print(f'    \'x\' Height: {x_height}')
-        print(f'    Capital Height: {cap_height}')
+        print(f'    \'x\' Height: {os_2["x_height"]}')
+        print(f'    Capital Height: {os_2["cap_height"]}')
         print(f'    Default Character: {default_char}')
-        print(f'    Break Character: U+{break_char:04X}')
-        print(f'    Maximum Context: {max_context}')
+        print(f'    Break Character: U+{os_2["break_char"]:04X}')
+        print(f'    Maximum Context: {os_2["max_context"]}')
+
+    if 'lower_optical_point_size' in os_2:
+        print(f'    Lower Optical Point Size: {os_2["lower_optical_point_size"]} TWIPs')
+        print(f'    Upper Optical Point Size: {os_2["upper_optical_point_size"]} TWIPs')
 
+@parses(b'OS/2')
+def _OS_2_parser(data):
+    '''Parse the OS/2 and Windows Metrics Table into a record'''
+    if len(data) < 68:
+        return {'length': len(data)}
+
+    fields = ('version', 'avg_char_width', 'weight_class', 'width_class',
+        'type_', 'subscript_x_size', 'subscript_y_size',
+        'subscript_x_offset', 'subscript_y_offset',
+        'superscript_x_size', 'superscript_y_size',
+        'superscript_x_offset', 'superscript_y_offset',
+        'strikeout_size', 'strikeout_position',
+        'family_class', 'panose',
+        'unicode_range_1', 'unicode_range_2',
+        'unicode_range_3', 'unicode_range_4',
+        'vend_id', 'selection', 'first_char_index', 'last_char_index')
+    record = dict(zip(fields, unpack('>Hh2H12h10s4I4s3H', data[:68])))
+    version = record['version']
+
+    if len(data) >= 78:
+        fields = ('typo_ascender', 'typo_descender', 'typo_line_gap',
+            'win_ascent', 'win_descent')
+        record.update(zip(fields, unpack('>3h2H', data[68:78])))
+    if version >= 1 and len(data) >= 86:
+        fields = ('code_page_range_1', 'code_page_range_2')
+        record.update(zip(fields, unpack('>2I', data[78:86])))
+    if version >= 2 and len(data) >= 96:
+        fields = ('x_height', 'cap_height', 'default_char', 'break_char',
+            'max_context')
+        record.update(zip(fields, unpack('>2h3H', data[86:96])))
     if version >= 5 and len(data) >= 100:
-        (lower_optical_point_size,
-            upper_optical_point_size) = unpack('>2H', data[96:100])
-        print(f'    Lower Optical Point Size: {lower_optical_point_size} TWIPs')
-        print(f'    Upper Optical Point Size: {upper_optical_point_size} TWIPs')
+        fields = ('lower_optical_point_size', 'upper_optical_point_size')
+        record.update(zip(fields, unpack('>2H', data[96:100])))
+    return record
 
 @handles(b'prep')
 def _prep_handler(tag, data):
@@ -552,12 +1059,17 @@ def _prep_handler(tag, data):
     '''
     print('PreProgram Table [prep]:')
 
-    bytestring = ' '.join([bytes([b]).hex() for b in data])
-    if len(bytestring) > 70 and not verbose:
-        bytestring = bytestring[:66] + '...'
-
     print(f'    Length: {len(data)}')
-    print(f'    Data: {bytestring}')
+    if len(data) > 23 and not verbose:
+        print(f'    Data: {data[:22].hex(" ")} ...')
+        return
+
+    print('    Data: ', end='')
+    for chunk_offset in range(0, len(data), 4096):
+        if chunk_offset:
+            print(' ', end='')
+        print(data[chunk_offset:chunk_offset+4096].hex(' '), end='')
+    print()
 
 #
 # Additional tables defined in TrueType reference manual
@@ -711,13 +1223,295 @@ def _CBDT_handler(tag, data):
 def _CBLC_handler(tag, data):
     print(f'{tag} table contains {len(data)} bytes')
 
+def _COLR_index(data):
+    '''Index the base glyph and layer records of a COLR table
+
+    The version 0 records and the version 1 BaseGlyphList and LayerList are
+    decoded into arrays, all offsets made relative to the start of the
+    table.  Paint tables are decoded later, on demand, by _COLR_paint, and
+    the 'paints' and 'resolved' dicts hold the decoded and resolved nodes,
+    and 'truncated' the nodes cut short by the depth limit, by offset and
+    depth.
+
+    '''
+    (version, num_base_glyph_records, base_glyph_records_offset,
+            layer_records_offset, num_layer_records) = unpack('>2H2IH', data[:14])
+
+    base_glyphs = (array('H'), array('H'), array('H'))
+    for record in iter_unpack('>3H', memoryview(data)[base_glyph_records_offset:
+            base_glyph_records_offset+num_base_glyph_records*6]):
+        for column, value in zip(base_glyphs, record):
+            column.append(value)
+    layers = (array('H'), array('H'))
+    for record in iter_unpack('>2H', memoryview(data)[layer_records_offset:
+            layer_records_offset+num_layer_records*4]):
+        for column, value in zip(layers, record):
+            column.append(value)
+
+    base_paints = (array('H'), array('I'))
+    layer_paints = array('I')
+    if version >= 1:
+        (base_glyph_list_offset, layer_list_offset) = unpack('>2I', data[14:22])
+        if base_glyph_list_offset:
+            (count,) = unpack('>I',
+                    data[base_glyph_list_offset:base_glyph_list_offset+4])
+            for (glyph_id, paint_offset) in iter_unpack('>HI', memoryview(data)[
+                    base_glyph_list_offset+4:base_glyph_list_offset+4+count*6]):
+                base_paints[0].append(glyph_id)
+                base_paints[1].append(base_glyph_list_offset + paint_offset)
+        if layer_list_offset:
+            (count,) = unpack('>I', data[layer_list_offset:layer_list_offset+4])
+            for (paint_offset,) in iter_unpack('>I', memoryview(data)[
+                    layer_list_offset+4:layer_list_offset+4+count*4]):
+                layer_paints.append(layer_list_offset + paint_offset)
+
+    return {
+        'data': data,
+        'version': version,
+        'base_glyphs': base_glyphs,
+        'layers': layers,
+        'base_paints': base_paints,
+        'layer_paints': layer_paints,
+        'paints': {},
+        'resolved': {},
+        'truncated': {},
+    }
+
+# Paint table formats: (name, struct format after the format byte, fields).
+# Fields named in _paint_offset_fields are Offset24s, relative to the paint.
+_paint_formats = {
+    1: ('PaintColrLayers', '>BI', ('num_layers', 'first_layer_index')),
+    2: ('PaintSolid', '>Hh', ('palette_index', 'alpha')),
+    4: ('PaintLinearGradient', '>3s6h',
+        ('color_line', 'x0', 'y0', 'x1', 'y1', 'x2', 'y2')),
+    6: ('PaintRadialGradient', '>3s2hH2hH',
+        ('color_line', 'x0', 'y0', 'radius0', 'x1', 'y1', 'radius1')),
+    8: ('PaintSweepGradient', '>3s4h',
+        ('color_line', 'center_x', 'center_y', 'start_angle', 'end_angle')),
+    10: ('PaintGlyph', '>3sH', ('paint', 'glyph_id')),
+    11: ('PaintColrGlyph', '>H', ('glyph_id',)),
+    12: ('PaintTransform', '>3s3s', ('paint', 'transform')),
+    14: ('PaintTranslate', '>3s2h', ('paint', 'dx', 'dy')),
+    16: ('PaintScale', '>3s2h', ('paint', 'scale_x', 'scale_y')),
+    18: ('PaintScaleAroundCenter', '>3s4h',
+         ('paint', 'scale_x', 'scale_y', 'center_x', 'center_y')),
+    20: ('PaintScaleUniform', '>3sh', ('paint', 'scale')),
+    22: ('PaintScaleUniformAroundCenter', '>3s3h',
+         ('paint', 'scale', 'center_x', 'center_y')),
+    24: ('PaintRotate', '>3sh', ('paint', 'angle')),
+    26: ('PaintRotateAroundCenter', '>3s3h',
+         ('paint', 'angle', 'center_x', 'center_y')),
+    28: ('PaintSkew', '>3s2h', ('paint', 'x_skew_angle', 'y_skew_angle')),
+    30: ('PaintSkewAroundCenter', '>3s4h',
+         ('paint', 'x_skew_angle', 'y_skew_angle', 'center_x', 'center_y')),
+    32: ('PaintComposite', '>3sB3s',
+         ('source_paint', 'composite_mode', 'backdrop_paint')),
+}
+# Each variable format follows its static one, adding a varIndexBase
+for _format in (2, 4, 6, 8, 12, 14, 16, 18, 20, 22, 24, 26, 28, 30):
+    (_name, _struct, _fields) = _paint_formats[_format]
+    if _format == 12:
+        # The variation index of PaintVarTransform is in its VarAffine2x3
+        _paint_formats[13] = ('PaintVarTransform', _struct, _fields)
+        continue
+    _paint_formats[_format+1] = (_name.replace('Paint', 'PaintVar'),
+            _struct + 'I', _fields + ('var_index_base',))
+del _format, _name, _struct, _fields
+
+_paint_offset_fields = {'color_line', 'paint', 'transform',
+                        'source_paint', 'backdrop_paint'}
+_paint_f2dot14_fields = {'alpha', 'start_angle', 'end_angle', 'scale',
+                         'scale_x', 'scale_y', 'angle',
+                         'x_skew_angle', 'y_skew_angle'}
+
+def _COLR_color_line(data, offset, variable):
+    (extend, num_stops) = unpack('>BH', data[offset:offset+3])
+    stop_size = 10 if variable else 6
+    stops = []
+    for stop in range(offset+3, offset+3+num_stops*stop_size, stop_size):
+        (stop_offset, palette_index, alpha) = unpack('>hHh', data[stop:stop+6])
+        stops.append((stop_offset / 0x4000, palette_index, alpha / 0x4000))
+    return {'extend': extend, 'stops': stops}
+
+def _COLR_paint(colr, offset):
+    '''Decode the Paint table at offset, once, leaving child paints as offsets'''
+    if offset in colr['paints']:
+        return colr['paints'][offset]
+
+    data = colr['data']
+    format_ = data[offset]
+    if format_ not in _paint_formats:
+        node = {'format': format_, 'type': 'Unknown'}
+        colr['paints'][offset] = node
+        return node
+
+    (name, struct_format, fields) = _paint_formats[format_]
+    size = calcsize(struct_format)
+    values = unpack(struct_format, data[offset+1:offset+1+size])
+    node = {'format': format_, 'type': name}
+    for field, value in zip(fields, values):
+        if field in _paint_offset_fields:
+            value = offset + int.from_bytes(value, 'big')
+            if field == 'color_line':
+                value = _COLR_color_line(data, value, format_ % 2)
+            elif field == 'transform':
+                transform = unpack('>6i', data[value:value+24])
+                value = tuple(x / 0x10000 for x in transform)
+        elif field in _paint_f2dot14_fields:
+            value /= 0x4000
+        node[field] = value
+    colr['paints'][offset] = node
+    return node
+
+def _COLR_base_paint(colr, glyph_id):
+    '''Find the offset of a glyph's root paint, None if it has none'''
+    (glyph_ids, paint_offsets) = colr['base_paints']
+    i = bisect_left(glyph_ids, glyph_id)
+    if i < len(glyph_ids) and glyph_ids[i] == glyph_id:
+        return paint_offsets[i]
+    return None
+
+def _COLR_resolve(colr, offset, active):
+    '''Resolve the paint graph below offset into nested nodes
+
+    active is the set of offsets on the path being resolved; a paint
+    already on it is replaced by a 'Cycle' node, and one past the maximum
+    depth by a 'Truncated' node.  Resolved nodes are memoized by offset
+    once complete, and shared between every glyph that uses them.  A node
+    whose subtree was cut by the depth limit depends on the depth it was
+    reached at, so it is memoized by offset and depth instead; either way
+    an offset is resolved a bounded number of times per font.
+
+    Returns (node, truncated).
+
+    '''
+    if offset in active:
+        return ({'format': None, 'type': 'Cycle', 'offset': offset}, False)
+    if offset in colr['resolved']:
+        return (colr['resolved'][offset], False)
+    depth = len(active)
+    if depth >= 64:
+        return ({'format': None, 'type': 'Truncated', 'offset': offset}, True)
+    if (offset, depth) in colr['truncated']:
+        return (colr['truncated'][(offset, depth)], True)
+
+    node = dict(_COLR_paint(colr, offset))
+    active.add(offset)
+    truncated = False
+    for field in ('paint', 'source_paint', 'backdrop_paint'):
+        if field in node:
+            (node[field], cut) = _COLR_resolve(colr, node[field], active)
+            truncated = truncated or cut
+    if node['format'] == 1:
+        first = node['first_layer_index']
+        node['layers'] = []
+        for layer_offset in colr['layer_paints'][first:first+node['num_layers']]:
+            (layer, cut) = _COLR_resolve(colr, layer_offset, active)
+            node['layers'].append(layer)
+            truncated = truncated or cut
+    elif node['format'] == 11:
+        base_offset = _COLR_base_paint(colr, node['glyph_id'])
+        if base_offset is not None:
+            (node['paint'], cut) = _COLR_resolve(colr, base_offset, active)
+            truncated = truncated or cut
+    active.discard(offset)
+
+    if truncated:
+        colr['truncated'][(offset, depth)] = node
+    else:
+        colr['resolved'][offset] = node
+    return (node, truncated)
+
 @handles(b'COLR')
 def _COLR_handler(tag, data):
-    print(f'{tag} table contains {len(data)} bytes')
+    '''Handler for the Color Table
+
+    https://docs.microsoft.com/en-us/typography/opentype/spec/colr
+
+    '''
+    print('Color Table [COLR]:')
+
+    colr = _COLR_index(data)
+    (glyph_ids, first_layers, layer_counts) = colr['base_glyphs']
+    (layer_glyphs, palette_indexes) = colr['layers']
+
+    print(f'    Version: {colr["version"]}')
+    print(f'    Number of Base Glyph Records: {len(glyph_ids)}')
+    print(f'    Number of Layer Records: {len(layer_glyphs)}')
+    print('    List of (Glyph, First Layer, Number of Layers):')
+    for i, (glyph_id, first, count) in enumerate(zip(
+            glyph_ids, first_layers, layer_counts)):
+        if not verbose and i >= 12:
+            print(' '*8 + '...')
+            print(' '*8 + '[Use -v to see the full table]')
+            print(' '*8 + '...')
+            break
+
+        layers = zip(layer_glyphs[first:first+count],
+                     palette_indexes[first:first+count])
+        print(' '*8 + f'({glyph_id},{first},{count}) {list(layers)}')
+
+    if colr['version'] >= 1:
+        (glyph_ids, paint_offsets) = colr['base_paints']
+        print(f'    Number of Base Glyph Paint Records: {len(glyph_ids)}')
+        print(f'    Number of Layer Paints: {len(colr["layer_paints"])}')
+        print('    List of (Glyph, Paint Offset) [Root Paint]:')
+        for i, (glyph_id, paint_offset) in enumerate(zip(
+                glyph_ids, paint_offsets)):
+            if not verbose and i >= 12:
+                print(' '*8 + '...')
+                print(' '*8 + '[Use -v to see the full table]')
+                print(' '*8 + '...')
+                break
+
+            paint = _COLR_paint(colr, paint_offset)
+            print(' '*8 + f'({glyph_id},{paint_offset}) [{paint["type"]}]')
+
+def _CPAL_index(data):
+    '''Decode the palettes of a CPAL table
+
+    Returns a list with one array per palette, holding each entry's color
+    as a 0xRRGGBBAA integer.
+
+    '''
+    (version, num_palette_entries, num_palettes, num_color_records,
+            color_records_array_offset) = unpack('>4HI', data[:12])
+    color_record_indices = unpack(f'>{num_palettes}H',
+            data[12:12+num_palettes*2])
+
+    colors = array('I')
+    for (blue, green, red, alpha) in iter_unpack('>4B', memoryview(data)[
+            color_records_array_offset:
+            color_records_array_offset+num_color_records*4]):
+        colors.append(red << 24 | green << 16 | blue << 8 | alpha)
+    return [colors[first:first+num_palette_entries]
+            for first in color_record_indices]
 
 @handles(b'CPAL')
 def _CPAL_handler(tag, data):
-    print(f'{tag} table contains {len(data)} bytes')
+    '''Handler for the Color Palette Table
+
+    https://docs.microsoft.com/en-us/typography/opentype/spec/cpal
+
+    '''
+    print('Color Palette Table [CPAL]:')
+
+    (version, num_palette_entries, num_palettes,
+            num_color_records) = unpack('>4H', data[:8])
+    palettes = _CPAL_index(data)
+
+    print(f'    Version: {version}')
+    print(f'    Number of Palette Entries: {num_palette_entries}')
+    print(f'    Number of Palettes: {num_palettes}')
+    print(f'    Number of Color Records: {num_color_records}')
+    for index, palette in enumerate(palettes):
+        print(f'    Palette {index}:', end='')
+        for i, color in enumerate(palette):
+            if not verbose and i >= 12:
+                print(' ...', end='')
+                break
+            print(f' #{color:08X}', end='')
+        print()
 
 @handles(b'DSIG')
 def _DSIG_handler(tag, data):
@@ -775,9 +1569,29 @@ def _JSTF_handler(tag, data):
 def _LINO_handler(tag, data):
     print(f'{tag} table contains {len(data)} bytes')
 
+def _LTSH_index(data):
+    '''Return the yPels thresholds of an LTSH table, indexed by glyph ID'''
+    (version, num_glyphs) = unpack('>2H', data[:4])
+    return data[4:4+num_glyphs]
+
 @handles(b'LTSH')
 def _LTSH_handler(tag, data):
-    print(f'{tag} table contains {len(data)} bytes')
+    '''Handler for the Linear Threshold Table
+
+    https://docs.microsoft.com/en-us/typography/opentype/spec/ltsh
+
+    '''
+    print('Linear Threshold Table [LTSH]:')
+
+    (version, num_glyphs) = unpack('>2H', data[:4])
+
+    print(f'    Version: {version}')
+    print(f'    Number of Glyphs: {num_glyphs}')
+    if num_glyphs <= 96 or verbose:
+        print('    Thresholds: ', end='')
+        _print_list(_LTSH_index(data))
+    else:
+        print('    ... [Use -v to see the thresholds list] ...')
 
 @handles(b'MATH')
 def _MATH_handler(tag, data):
@@ -811,36 +1625,1111 @@ def _Silt_handler(tag, data):
 def _TSIV_handler(tag, data):
     print(f'{tag} table contains {len(data)} bytes')
 
+def _VDMX_index(data):
+    '''Index the ratio records and groups of a VDMX table
+
+    Returns (ratios, groups).  Each ratio is (char_set, x_ratio,
+    y_start_ratio, y_end_ratio, group_index); each group is (start_size,
+    end_size, heights, y_maxes, y_mins), the last three being parallel
+    arrays sorted by pixel height.  Ratios sharing an offset share a group.
+
+    '''
+    (version, num_recs, num_ratios) = unpack('>3H', data[:6])
+    ratio_records = list(iter_unpack('>4B', data[6:6+num_ratios*4]))
+    offsets = unpack(f'>{num_ratios}H',
+            data[6+num_ratios*4:6+num_ratios*6])
+
+    ratios = []
+    groups = []
+    group_indexes = {}
+    for (char_set, x_ratio, y_start_ratio, y_end_ratio), offset in zip(
+            ratio_records, offsets):
+        if offset not in group_indexes:
+            (recs, start_size, end_size) = unpack('>H2B', data[offset:offset+4])
+            heights, y_maxes, y_mins = array('H'), array('h'), array('h')
+            for (y_pel_height, y_max, y_min) in iter_unpack('>H2h',
+                    memoryview(data)[offset+4:offset+4+recs*6]):
+                heights.append(y_pel_height)
+                y_maxes.append(y_max)
+                y_mins.append(y_min)
+            group_indexes[offset] = len(groups)
+            groups.append((start_size, end_size, heights, y_maxes, y_mins))
+        ratios.append((char_set, x_ratio, y_start_ratio, y_end_ratio,
+                       group_indexes[offset]))
+    return (ratios, groups)
+
+def _VDMX_lookup(vdmx, ppem, ratio=(1, 1)):
+    '''Find (y_max, y_min) for a pixel size at an x:y device aspect ratio
+
+    Returns None if the first matching group has no entry for the size.
+
+    '''
+    (ratios, groups) = vdmx
+    (x, y) = ratio
+    for (char_set, x_ratio, y_start_ratio, y_end_ratio, group) in ratios:
+        if (x_ratio == 0 and y_start_ratio == 0 and y_end_ratio == 0) or (
+                y_start_ratio*x <= y*x_ratio <= y_end_ratio*x):
+            break
+    else:
+        return None
+
+    (start_size, end_size, heights, y_maxes, y_mins) = groups[group]
+    i = bisect_left(heights, ppem)
+    if i == len(heights) or heights[i] != ppem:
+        return None
+    return (y_maxes[i], y_mins[i])
+
 @handles(b'VDMX')
 def _VDMX_handler(tag, data):
-    print(f'{tag} table contains {len(data)} bytes')
+    '''Handler for the Vertical Device Metrics Table
+
+    https://docs.microsoft.com/en-us/typography/opentype/spec/vdmx
+
+    '''
+    print('Vertical Device Metrics Table [VDMX]:')
+
+    (version, num_recs, num_ratios) = unpack('>3H', data[:6])
+    (ratios, groups) = _VDMX_index(data)
+
+    print(f'    Version: {version}')
+    print(f'    Number of Groups: {num_recs}')
+    print(f'    Number of Ratio Records: {num_ratios}')
+    print('    List of (Character Set, x Ratio, y Start Ratio, y End Ratio, Group):')
+    for ratio in ratios:
+        print(' '*8 + f'({",".join(map(str, ratio))})')
+    for index, (start_size, end_size, heights, y_maxes, y_mins) in enumerate(
+            groups):
+        print(f'    Group {index}:')
+        print(' '*8 + f'Size Range: {start_size}..{end_size}')
+        print(' '*8 + f'Number of Records: {len(heights)}')
+        print(' '*8 + 'List of (Pixel Height, y Max, y Min):')
+        for i, entry in enumerate(zip(heights, y_maxes, y_mins)):
+            if not verbose and i >= 12:
+                print(' '*12 + '...')
+                print(' '*12 + '[Use -v to see the full table]')
+                print(' '*12 + '...')
+                break
+
+            print(' '*12 + f'({",".join(map(str, entry))})')
 
 @handles(b'webf')
 def _webf_handler(tag, data):
     print(f'{tag} table contains {len(data)} bytes')
 
 
+#
+# Font comparison
+#
+
+def _first_difference(old_data, new_data):
+    for index, (old_byte, new_byte) in enumerate(zip(old_data, new_data)):
+        if old_byte != new_byte:
+            return index
+    return min(len(old_data), len(new_data))
+
+def _diff_records(old_record, new_record):
+    for key in old_record:
+        if key not in new_record:
+            print(f'    {key}: {old_record[key]!r} => [removed]')
+        elif old_record[key] != new_record[key]:
+            print(f'    {key}: {old_record[key]!r} => {new_record[key]!r}')
+    for key in new_record:
+        if key not in old_record:
+            print(f'    {key}: [added] => {new_record[key]!r}')
+
+def diff_fonts(old_path, new_path):
+    '''Compare two fonts, table by table
+
+    The table directories are compared first, and any table whose checksum
+    and length are unchanged is skipped without being read.  Changed tables
+    that have a parser are compared field by field; the rest are reported
+    by size and first differing byte.
+
+    '''
+    with open(old_path, 'rb') as old_f, open(new_path, 'rb') as new_f:
+        old_tables = {tag: (checksum, offset, length)
+                for tag, checksum, offset, length in _read_table_directory(old_f)}
+        new_tables = {tag: (checksum, offset, length)
+                for tag, checksum, offset, length in _read_table_directory(new_f)}
+
+        unchanged = 0
+        for tag in old_tables:
+            if tag not in new_tables:
+                print(f'Table {tag} removed')
+                continue
+            (old_checksum, old_offset, old_length) = old_tables[tag]
+            (new_checksum, new_offset, new_length) = new_tables[tag]
+            if old_checksum == new_checksum and old_length == new_length:
+                unchanged += 1
+                continue
+
+            old_f.seek(old_offset)
+            old_data = old_f.read(old_length)
+            new_f.seek(new_offset)
+            new_data = new_f.read(new_length)
+            if old_data == new_data:
+                # Only the checksum in the directory changed
+                unchanged += 1
+                continue
+
+            if tag in _parsers:
+                try:
+                    old_record = _parsers[tag](old_data)
+                    new_record = _parsers[tag](new_data)
+                except (struct_error, IndexError) as e:
+                    print(f'Table {tag} could not be parsed: {e}')
+                else:
+                    if old_record != new_record:
+                        print(f'Table {tag} differs:')
+                        _diff_records(old_record, new_record)
+                        continue
+            print(f'Table {tag} differs: {old_length} bytes => {new_length} bytes,'
+                  f' first difference at byte {_first_difference(old_data, new_data)}')
+
+        for tag in new_tables:
+            if tag not in old_tables:
+                print(f'Table {tag} added')
+
+        print(f'{unchanged} tables unchanged')
+
+
+#
+# Text measurement
+#
+
+@lru_cache(maxsize=16)
+def _load_tables(path):
+    '''Read every table of a font into memory, keyed by tag'''
+    with open(path, 'rb') as f:
+        font = f.read()
+        f.seek(0)
+        return {tag: font[offset:offset+length]
+                for tag, checksum, offset, length in _read_table_directory(f)}
+
+# Decoders for the tables the measurement functions index, see _decode_table
+_table_decoders = {
+    b'cmap': lambda data: _cmap_unicode(_cmap_decode(data)),
+    b'hdmx': _hdmx_index,
+    b'VDMX': _VDMX_index,
+    b'LTSH': _LTSH_index,
+    b'COLR': _COLR_index,
+    b'CPAL': _CPAL_index,
+}
+
+@lru_cache(maxsize=64)
+def _decode_table(tag, data, *args):
+    '''Decode a table once per distinct content, whichever font it is in
+
+    The cache is keyed by the table bytes rather than the font path, so a
+    table shared between fonts, such as the cmap of the weights of a
+    family, is decoded once for all of them.
+
+    '''
+    return _table_decoders[tag](data, *args)
+
+@lru_cache(maxsize=16)
+def _font_metrics(path):
+    '''Gather the per-font metric block used by measure()
+
+    The vertical metrics follow the OS/2 USE_TYPO_METRICS selection bit,
+    falling back from hhea to the Windows metrics when hhea has none.
+    Descents are positive distances below the baseline.
+
+    '''
+    tables = _load_tables(path)
+    head = _parsers[b'head'](tables[b'head'])
+    hhea = _parsers[b'hhea'](tables[b'hhea'])
+    maxp = _parsers[b'maxp'](tables[b'maxp'])
+    os_2 = _parsers[b'OS/2'](tables[b'OS/2']) if b'OS/2' in tables else {}
+
+    candidates = {'hhea': (hhea['ascender'], -hhea['descender'],
+                           hhea['line_gap'])}
+    if 'typo_ascender' in os_2:
+        candidates['typo'] = (os_2['typo_ascender'], -os_2['typo_descender'],
+                              os_2['typo_line_gap'])
+        candidates['win'] = (os_2['win_ascent'], os_2['win_descent'], 0)
+
+    if 'typo' in candidates and os_2['selection'] & 0x80:
+        source = 'typo'
+    elif hhea['ascender'] or hhea['descender'] or 'win' not in candidates:
+        source = 'hhea'
+    else:
+        source = 'win'
+    (ascent, descent, line_gap) = candidates[source]
+
+    return {
+        'units_per_em': head['units_per_em'],
+        'index_to_loc_format': head['index_to_loc_format'],
+        'number_of_h_metrics': hhea['number_of_h_metrics'],
+        'num_glyphs': maxp['num_glyphs'],
+        'candidates': candidates,
+        'source': source,
+        'ascent': ascent,
+        'descent': descent,
+        'line_gap': line_gap,
+        'cmap': _decode_table(b'cmap', tables[b'cmap']),
+    }
+
+@lru_cache(maxsize=65536)
+def _glyph_metrics(path, glyph_id):
+    '''Return (advance, bounding box) for a glyph, in font units
+
+    The bounding box is (x_min, y_min, x_max, y_max), or None for a glyph
+    with no outline or a font without a glyf table.  Glyph IDs past
+    maxp.numGlyphs are measured as glyph 0, the missing glyph.
+
+    '''
+    tables = _load_tables(path)
+    metrics = _font_metrics(path)
+    if glyph_id >= metrics['num_glyphs']:
+        glyph_id = 0
+
+    hmtx = tables[b'hmtx']
+    metric_index = min(glyph_id, metrics['number_of_h_metrics'] - 1)
+    (advance,) = unpack('>H', hmtx[metric_index*4:metric_index*4+2])
+
+    if b'glyf' not in tables or b'loca' not in tables:
+        return (advance, None)
+    loca = tables[b'loca']
+    if metrics['index_to_loc_format'] == 0:
+        (start, end) = (x*2 for x in unpack('>2H', loca[glyph_id*2:glyph_id*2+4]))
+    else:
+        (start, end) = unpack('>2I', loca[glyph_id*4:glyph_id*4+8])
+    if start == end:
+        return (advance, None)
+    return (advance, unpack('>4h', tables[b'glyf'][start+2:start+10]))
+
+def measure(path, text, size):
+    '''Measure a string as a canvas 2D context would, without shaping
+
+    Returns a dict in pixels for the given font size.  Vertical values are
+    distances above the alphabetic baseline, descents are distances below
+    it.  The baselines use Blink's fallbacks for fonts without a BASE table:
+    hanging at 80% of the ascent and ideographic at the descent.  Kerning
+    and other layout features are not applied.
+
+    '''
+    path = _font_aliases.get(path, path)
+    metrics = _font_metrics(path)
+    scale = size / metrics['units_per_em']
+    (ranges, variations) = metrics['cmap']
+
+    pen = 0
+    ink = None
+    for glyph_id in _cmap_glyphs(ranges, variations, text):
+        (advance, bbox) = _glyph_metrics(path, glyph_id)
+        if bbox is not None:
+            (x_min, y_min, x_max, y_max) = bbox
+            bbox = (pen + x_min, y_min, pen + x_max, y_max)
+            if ink is None:
+                ink = bbox
+            else:
+                ink = (min(ink[0], bbox[0]), min(ink[1], bbox[1]),
+                       max(ink[2], bbox[2]), max(ink[3], bbox[3]))
+        pen += advance
+    if ink is None:
+        ink = (0, 0, 0, 0)
+
+    ascent = metrics['ascent'] * scale
+    descent = metrics['descent'] * scale
+    return {
+        'width': pen * scale,
+        'actual_bounding_box_left': -ink[0] * scale,
+        'actual_bounding_box_right': ink[2] * scale,
+        'actual_bounding_box_ascent': ink[3] * scale,
+        'actual_bounding_box_descent': -ink[1] * scale,
+        'font_bounding_box_ascent': ascent,
+        'font_bounding_box_descent': descent,
+        'line_gap': metrics['line_gap'] * scale,
+        'metrics_source': metrics['source'],
+        'baselines': {
+            'top': ascent,
+            'hanging': ascent * 0.8,
+            'middle': (ascent - descent) / 2,
+            'alphabetic': 0,
+            'ideographic': -descent,
+            'bottom': -descent,
+        },
+    }
+
+@lru_cache(maxsize=16)
+def _device_tables(path):
+    '''Index the hdmx, VDMX and LTSH tables of a font, None where absent'''
+    tables = _load_tables(path)
+    maxp = _parsers[b'maxp'](tables[b'maxp'])
+    return (_decode_table(b'hdmx', tables[b'hdmx'], maxp['num_glyphs'])
+                if b'hdmx' in tables else None,
+            _decode_table(b'VDMX', tables[b'VDMX'])
+                if b'VDMX' in tables else None,
+            _decode_table(b'LTSH', tables[b'LTSH'])
+                if b'LTSH' in tables else None)
+
+def device_metrics(path, glyph_ids, ppems, ratio=(1, 1)):
+    '''Look up device metrics for a glyph sequence at several pixel sizes
+
+    Returns a list with one dict per ppem, holding the integer advance of
+    each glyph and the y_max/y_min of the font at that size.  Advances come
+    from the hdmx record for the size, unless LTSH says the glyph scales
+    linearly there or there is no record, in which case the hmtx advance is
+    scaled and rounded.  y_max/y_min come from VDMX for the x:y device
+    ratio, falling back to the head bounding box rounded outwards.
+
+    '''
+    path = _font_aliases.get(path, path)
+    (hdmx, vdmx, ltsh) = _device_tables(path)
+    metrics = _font_metrics(path)
+    units_per_em = metrics['units_per_em']
+    head = _parsers[b'head'](_load_tables(path)[b'head'])
+    glyph_ids = list(glyph_ids)
+    advances = [_glyph_metrics(path, glyph_id)[0] for glyph_id in glyph_ids]
+
+    results = []
+    for ppem in ppems:
+        record = hdmx.get(ppem) if hdmx is not None else None
+        device_advances = []
+        for glyph_id, advance in zip(glyph_ids, advances):
+            if (record is not None and glyph_id < len(record[1])
+                    and (ltsh is None or glyph_id >= len(ltsh)
+                         or ppem < ltsh[glyph_id])):
+                device_advances.append(record[1][glyph_id])
+            else:
+                device_advances.append(
+                        int(advance * ppem / units_per_em + 0.5))
+
+        y_extents = _VDMX_lookup(vdmx, ppem, ratio) if vdmx is not None else None
+        if y_extents is None:
+            y_extents = (-(-head['y_max'] * ppem // units_per_em),
+                         head['y_min'] * ppem // units_per_em)
+        results.append({'ppem': ppem, 'advances': device_advances,
+                        'y_max': y_extents[0], 'y_min': y_extents[1]})
+    return results
+
+
+#
+# Color glyphs
+#
+
+@lru_cache(maxsize=16)
+def _color_tables(path):
+    '''Index the COLR and CPAL tables of a font, None where absent
+
+    The COLR index also carries the table's decoded and resolved paints, so
+    they are shared by every color_glyphs() call on any font with the same
+    COLR table.
+
+    '''
+    tables = _load_tables(path)
+    return (_decode_table(b'COLR', tables[b'COLR'])
+                if b'COLR' in tables else None,
+            _decode_table(b'CPAL', tables[b'CPAL'])
+                if b'CPAL' in tables else None)
+
+def color_glyphs(path, glyph_ids, palette=0):
+    '''Look up the color layers or paint graph for each of a list of glyphs
+
+    Returns a list with one entry per glyph: None for a glyph with no color
+    data, {'paint': node, 'palette': colors} for a COLR version 1 glyph, or
+    {'layers': [(glyph_id, color), ...]} for a version 0 glyph.  Colors are
+    0xRRGGBBAA integers, with None standing for the text foreground color;
+    the palette indexes in a paint graph refer to the returned palette.
+    Paint nodes are resolved once per font and shared between glyphs.
+
+    '''
+    path = _font_aliases.get(path, path)
+    (colr, palettes) = _color_tables(path)
+    colors = palettes[palette] if palettes else array('I')
+
+    results = []
+    for glyph_id in glyph_ids:
+        if colr is None:
+            results.append(None)
+            continue
+
+        paint_offset = _COLR_base_paint(colr, glyph_id)
+        if paint_offset is not None:
+            (paint, _) = _COLR_resolve(colr, paint_offset, set())
+            results.append({'paint': paint, 'palette': colors})
+            continue
+
+        (base_glyph_ids, first_layers, layer_counts) = colr['base_glyphs']
+        i = bisect_left(base_glyph_ids, glyph_id)
+        if i == len(base_glyph_ids) or base_glyph_ids[i] != glyph_id:
+            results.append(None)
+            continue
+        (layer_glyphs, palette_indexes) = colr['layers']
+        first = first_layers[i]
+        layers = []
+        for layer_glyph, palette_index in zip(
+                layer_glyphs[first:first+layer_counts[i]],
+                palette_indexes[first:first+layer_counts[i]]):
+            color = colors[palette_index] if palette_index < len(colors) else None
+            layers.append((layer_glyph, color))
+        results.append({'layers': layers})
+    return results
+
+
+#
+# Corpus fingerprinting
+#
+
+_font_aliases = {}
+
+def fingerprint_corpus(paths):
+    '''Group byte-identical tables and fonts across a set of font files
+
+    Each table is fingerprinted by (tag, checksum, length, digest), where
+    digest is a SHA-256 of the table contents, computed only for tables
+    whose tag, directory checksum and length collide with another table's,
+    and None otherwise.  A font's fingerprint is the sorted tuple of its
+    table fingerprints.
+
+    Returns (tables, fonts, unreadable): tables maps each table fingerprint
+    to a list of (path, tag) pairs, fonts maps each font fingerprint to a
+    list of paths, and unreadable lists (path, reason) for the files that
+    could not be opened or whose table directory is not that of a complete
+    font.  Each file is opened once to read its directory and at most once
+    more to hash its colliding tables.
+
+    '''
+    directories = {}
+    unreadable = []
+    candidates = {}
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                directory = _read_table_directory(f)
+                size = f.seek(0, 2)
+        except (OSError, struct_error) as e:
+            unreadable.append((path, str(e)))
+            continue
+        if any(offset + length > size for (_, _, offset, length) in directory):
+            unreadable.append((path, f'table data extends past end of file'
+                                     f' ({size} bytes)'))
+            continue
+        directories[path] = directory
+        for tag, checksum, offset, length in directory:
+            candidates.setdefault((tag, checksum, length), []).append(
+                    (path, offset))
+
+    colliding = {}
+    for (tag, checksum, length), entries in candidates.items():
+        if len(entries) < 2:
+            continue
+        for path, offset in entries:
+            colliding.setdefault(path, []).append((offset, length, tag))
+
+    digests = {}
+    for path, entries in colliding.items():
+        try:
+            with open(path, 'rb') as f:
+                for offset, length, tag in sorted(entries):
+                    f.seek(offset)
+                    digests[(path, tag)] = sha256(f.read(length)).hexdigest()
+        except OSError as e:
+            unreadable.append((path, str(e)))
+            del directories[path]
+
+    tables = {}
+    fonts = {}
+    for path, directory in directories.items():
+        font_fingerprint = []
+        for tag, checksum, offset, length in directory:
+            fingerprint = (tag, checksum, length, digests.get((path, tag)))
+            tables.setdefault(fingerprint, []).append((path, tag))
+            font_fingerprint.append(fingerprint)
+        fonts.setdefault(tuple(sorted(font_fingerprint)), []).append(path)
+    return (tables, fonts, unreadable)
+
+def share_duplicates(fonts):
+    '''Let duplicate fonts share cached results with their first copy
+
+    fonts is the second result of fingerprint_corpus().  Afterwards
+    measure(), device_metrics() and color_glyphs() on any duplicate reuse
+    the tables and metrics already cached for the first path of its group,
+    without reading the duplicate at all.  Identical tables in otherwise
+    different fonts need no aliasing, as their decodes are cached by
+    content; see _decode_table.
+
+    '''
+    for paths in fonts.values():
+        for path in paths[1:]:
+            _font_aliases[path] = paths[0]
+
+def _print_corpus(tables, fonts, unreadable):
+    if unreadable:
+        print('Unreadable Fonts:')
+        for path, reason in unreadable:
+            print(f'    {path}: {reason}')
+
+    print('Identical Fonts:')
+    for paths in fonts.values():
+        if len(paths) > 1:
+            print(f'    {", ".join(paths)}')
+
+    print('Identical Tables:')
+    for (tag, checksum, length, digest), entries in tables.items():
+        if len(entries) > 1:
+            print(f'    {tag} ({length} bytes, checksum 0x{checksum:08X}):')
+            for path, _ in entries:
+                print(f'        {path}')
+
+
+#
+# Validation
+#
+
+class _Malformed(Exception):
+    '''Raised at the first problem found in a table, or in the directory'''
+
+    def __init__(self, offset, message):
+        super().__init__(message)
+        self.offset = offset
+        self.message = message
+
+def _need(data, offset, size, what):
+    '''Check that size bytes at offset lie within data'''
+    if offset < 0 or size < 0 or offset + size > len(data):
+        raise _Malformed(offset, f'{what} ({size} bytes at {offset}) extends'
+                                 f' past end of table ({len(data)} bytes)')
+
+_validators = {}
+def validates(tag):
+    def real_validates(func):
+        _validators[tag] = func
+        return func
+    return real_validates
+
+@validates(b'cmap')
+def _cmap_validator(data):
+    _need(data, 0, 4, 'cmap header')
+    (version, num_tables) = unpack('>HH', data[:4])
+    _need(data, 4, num_tables*8, 'encoding records')
+
+    for (platform_id, platform_specific_id, offset) in iter_unpack('>2HI',
+            data[4:4+num_tables*8]):
+        encoding = f'encoding ({platform_id}, {platform_specific_id})'
+        _need(data, offset, 2, f'{encoding} format')
+        (format_,) = unpack('>H', data[offset:offset+2])
+        if format_ in {0, 2, 4, 6}:
+            _need(data, offset, 6, f'{encoding} header')
+            (length,) = unpack('>H', data[offset+2:offset+4])
+        elif format_ in {8, 10, 12, 13, 14}:
+            _need(data, offset, 8, f'{encoding} header')
+            if format_ == 14:
+                (length,) = unpack('>I', data[offset+2:offset+6])
+            else:
+                (length,) = unpack('>I', data[offset+4:offset+8])
+        else:
+            raise _Malformed(offset, f'{encoding} has unknown format {format_}')
+        _need(data, offset, length, f'{encoding} subtable')
+        subtable = data[offset:offset+length]
+
+        if format_ == 0:
+            _need(subtable, 6, 256, f'{encoding} glyph index array')
+        elif format_ == 2:
+            _need(subtable, 6, 512, f'{encoding} sub-header keys')
+            for high_byte, key in enumerate(unpack('>256H', subtable[6:518])):
+                if key % 8:
+                    raise _Malformed(offset+6+high_byte*2,
+                            f'{encoding} sub-header key {key} is misaligned')
+                sub_header = 518 + key
+                _need(subtable, sub_header, 8, f'{encoding} sub-header {key//8}')
+                (first_code, entry_count, id_delta, id_range_offset) = unpack(
+                        '>2HhH', subtable[sub_header:sub_header+8])
+                if first_code + entry_count > 256:
+                    raise _Malformed(offset+sub_header,
+                            f'{encoding} sub-header {key//8} runs past 0xFF')
+                _need(subtable, sub_header + 6 + id_range_offset, entry_count*2,
+                        f'{encoding} sub-header {key//8} glyph range')
+        elif format_ == 4:
+            _need(subtable, 6, 8, f'{encoding} segment header')
+            (seg_count_x2,) = unpack('>H', subtable[6:8])
+            if seg_count_x2 % 2:
+                raise _Malformed(offset+6,
+                        f'{encoding} has odd segment count \xd7 2 {seg_count_x2}')
+            _need(subtable, 14, seg_count_x2*4 + 2, f'{encoding} segment arrays')
+            range_offset_base = 16 + seg_count_x2*3
+            previous_end = -1
+            for i, (start, end, delta, range_offset) in enumerate(
+                    _cmap_format_4_segments(subtable, 14, seg_count_x2)):
+                if start > end or start <= previous_end:
+                    raise _Malformed(offset+14+i*2,
+                            f'{encoding} segment {i} ({start}..{end}) is'
+                            f' out of order')
+                previous_end = end
+                if range_offset != 0:
+                    _need(subtable, range_offset_base + i*2 + range_offset,
+                            (end - start + 1) * 2,
+                            f'{encoding} segment {i} glyph range')
+            if previous_end != 0xFFFF:
+                raise _Malformed(offset+14,
+                        f'{encoding} does not end with a 0xFFFF segment')
+        elif format_ == 6:
+            _need(subtable, 6, 4, f'{encoding} range header')
+            (first_code, entry_count) = unpack('>2H', subtable[6:10])
+            _need(subtable, 10, entry_count*2, f'{encoding} glyph index array')
+        elif format_ == 10:
+            _need(subtable, 12, 8, f'{encoding} range header')
+            (start_char_code, num_chars) = unpack('>2I', subtable[12:20])
+            _need(subtable, 20, num_chars*2, f'{encoding} glyph index array')
+        elif format_ in {8, 12, 13}:
+            # Format 8 has an 8192-byte is32 bitmap ahead of the groups
+            groups = 8208 if format_ == 8 else 16
+            _need(subtable, groups - 4, 4, f'{encoding} group count')
+            (num_groups,) = unpack('>I', subtable[groups-4:groups])
+            _need(subtable, groups, num_groups*12, f'{encoding} groups')
+            previous_end = -1
+            for i, (start, end, start_glyph) in enumerate(iter_unpack('>3I',
+                    subtable[groups:groups+num_groups*12])):
+                if start > end or start <= previous_end:
+                    raise _Malformed(offset+groups+i*12,
+                            f'{encoding} group {i} ({start}..{end}) is'
+                            f' out of order')
+                previous_end = end
+        elif format_ == 14:
+            _need(subtable, 6, 4, f'{encoding} record count')
+            (num_records,) = unpack('>I', subtable[6:10])
+            _need(subtable, 10, num_records*11, f'{encoding} selector records')
+            previous_selector = -1
+            for record in range(10, 10+num_records*11, 11):
+                selector = int.from_bytes(subtable[record:record+3], 'big')
+                if selector <= previous_selector:
+                    raise _Malformed(offset+record, f'{encoding} selector'
+                                     f' U+{selector:04X} is out of order')
+                previous_selector = selector
+                (default_offset, non_default_offset) = unpack('>2I',
+                        subtable[record+3:record+11])
+                for table, size, what in ((default_offset, 4, 'default'),
+                        (non_default_offset, 5, 'non-default')):
+                    if table:
+                        _need(subtable, table, 4,
+                                f'{encoding} U+{selector:04X} {what} UVS count')
+                        (count,) = unpack('>I', subtable[table:table+4])
+                        _need(subtable, table + 4, count*size,
+                                f'{encoding} U+{selector:04X} {what} UVS records')
+    return {}
+
+@validates(b'hdmx')
+def _hdmx_validator(data):
+    _need(data, 0, 8, 'hdmx header')
+    (version, num_records, size_device_record) = unpack('>Hhi', data[:8])
+    if num_records < 0 or size_device_record < 2:
+        raise _Malformed(2, f'{num_records} device records of'
+                            f' {size_device_record} bytes')
+    _need(data, 8, num_records*size_device_record, 'device records')
+    return {'size_device_record': size_device_record}
+
+@validates(b'LTSH')
+def _LTSH_validator(data):
+    _need(data, 0, 4, 'LTSH header')
+    (version, num_glyphs) = unpack('>2H', data[:4])
+    _need(data, 4, num_glyphs, 'yPels array')
+    return {'num_glyphs': num_glyphs}
+
+@validates(b'VDMX')
+def _VDMX_validator(data):
+    _need(data, 0, 6, 'VDMX header')
+    (version, num_recs, num_ratios) = unpack('>3H', data[:6])
+    _need(data, 6, num_ratios*6, 'ratio records')
+    for i, offset in enumerate(unpack(f'>{num_ratios}H',
+            data[6+num_ratios*4:6+num_ratios*6])):
+        _need(data, offset, 4, f'ratio {i} group header')
+        (recs, start_size, end_size) = unpack('>H2B', data[offset:offset+4])
+        _need(data, offset + 4, recs*6, f'ratio {i} group records')
+        heights = [height for (height, y_max, y_min) in iter_unpack('>H2h',
+                data[offset+4:offset+4+recs*6])]
+        if heights != sorted(heights):
+            raise _Malformed(offset + 4, f'ratio {i} group records out of order')
+    return {}
+
+@validates(b'COLR')
+def _COLR_validator(data):
+    _need(data, 0, 14, 'COLR header')
+    (version, num_base_glyph_records, base_glyph_records_offset,
+            layer_records_offset, num_layer_records) = unpack('>2H2IH', data[:14])
+    _need(data, base_glyph_records_offset, num_base_glyph_records*6,
+            'base glyph records')
+    _need(data, layer_records_offset, num_layer_records*4, 'layer records')
+    previous_glyph_id = -1
+    for i, (glyph_id, first_layer_index, num_layers) in enumerate(iter_unpack(
+            '>3H', data[base_glyph_records_offset:
+                        base_glyph_records_offset+num_base_glyph_records*6])):
+        if glyph_id <= previous_glyph_id:
+            raise _Malformed(base_glyph_records_offset + i*6,
+                    f'base glyph record {i} is out of order')
+        previous_glyph_id = glyph_id
+        if first_layer_index + num_layers > num_layer_records:
+            raise _Malformed(base_glyph_records_offset + i*6,
+                    f'base glyph record {i} refers past the layer records')
+
+    if version >= 1:
+        _need(data, 14, 20, 'COLR version 1 header')
+        (base_glyph_list_offset, layer_list_offset) = unpack('>2I', data[14:22])
+        for offset, size, what in ((base_glyph_list_offset, 6, 'base glyph list'),
+                (layer_list_offset, 4, 'layer list')):
+            if offset:
+                _need(data, offset, 4, f'{what} count')
+                (count,) = unpack('>I', data[offset:offset+4])
+                _need(data, offset + 4, count*size, f'{what} records')
+
+        # Walk every paint reachable from the two lists, once each
+        paints = []
+        num_layer_paints = 0
+        if base_glyph_list_offset:
+            (count,) = unpack('>I',
+                    data[base_glyph_list_offset:base_glyph_list_offset+4])
+            previous_glyph_id = -1
+            for i, (glyph_id, paint_offset) in enumerate(iter_unpack('>HI',
+                    data[base_glyph_list_offset+4:
+                         base_glyph_list_offset+4+count*6])):
+                if glyph_id <= previous_glyph_id:
+                    raise _Malformed(base_glyph_list_offset + 4 + i*6,
+                            f'base glyph paint record {i} is out of order')
+                previous_glyph_id = glyph_id
+                paints.append((base_glyph_list_offset + paint_offset,
+                               f'base glyph paint record {i} paint'))
+        if layer_list_offset:
+            (num_layer_paints,) = unpack('>I',
+                    data[layer_list_offset:layer_list_offset+4])
+            for i, (paint_offset,) in enumerate(iter_unpack('>I',
+                    data[layer_list_offset+4:
+                         layer_list_offset+4+num_layer_paints*4])):
+                paints.append((layer_list_offset + paint_offset,
+                               f'layer paint {i}'))
+
+        seen = set()
+        while paints:
+            (offset, what) = paints.pop()
+            if offset in seen:
+                continue
+            seen.add(offset)
+            _need(data, offset, 1, what)
+            format_ = data[offset]
+            if format_ not in _paint_formats:
+                continue
+            (name, struct_format, fields) = _paint_formats[format_]
+            size = calcsize(struct_format)
+            _need(data, offset + 1, size, f'{name} at {offset}')
+            values = dict(zip(fields, unpack(struct_format,
+                    data[offset+1:offset+1+size])))
+            for field, value in values.items():
+                if field not in _paint_offset_fields:
+                    continue
+                child = offset + int.from_bytes(value, 'big')
+                child_what = f'{name} at {offset} {field}'
+                if field == 'color_line':
+                    _need(data, child, 3, child_what)
+                    (num_stops,) = unpack('>H', data[child+1:child+3])
+                    stop_size = 10 if format_ % 2 else 6
+                    _need(data, child + 3, num_stops*stop_size,
+                            f'{child_what} stops')
+                elif field == 'transform':
+                    _need(data, child, 24, child_what)
+                else:
+                    paints.append((child, child_what))
+            if format_ == 1 and (values['first_layer_index']
+                    + values['num_layers'] > num_layer_paints):
+                raise _Malformed(offset, f'{name} at {offset} refers past'
+                                         f' the layer list')
+    return {}
+
+@validates(b'CPAL')
+def _CPAL_validator(data):
+    _need(data, 0, 12, 'CPAL header')
+    (version, num_palette_entries, num_palettes, num_color_records,
+            color_records_array_offset) = unpack('>4HI', data[:12])
+    _need(data, 12, num_palettes*2, 'color record indices')
+    _need(data, color_records_array_offset, num_color_records*4, 'color records')
+    for i, (first,) in enumerate(iter_unpack('>H', data[12:12+num_palettes*2])):
+        if first + num_palette_entries > num_color_records:
+            raise _Malformed(12 + i*2, f'palette {i} runs past the color records')
+    return {}
+
+@validates(b'head')
+def _head_validator(data):
+    _need(data, 0, 54, 'head table')
+    head = _head_parser(data)
+    if head['magic_number'] != 0x5F0F3CF5:
+        raise _Malformed(12, f'bad magic number 0x{head["magic_number"]:08X}')
+    if not 16 <= head['units_per_em'] <= 16384:
+        raise _Malformed(18, f'units per em {head["units_per_em"]} out of range')
+    if head['index_to_loc_format'] not in {0, 1}:
+        raise _Malformed(50, 'unknown index to loc format'
+                             f' {head["index_to_loc_format"]}')
+    return head
+
+@validates(b'hhea')
+def _hhea_validator(data):
+    _need(data, 0, 36, 'hhea table')
+    return _hhea_parser(data)
+
+@validates(b'maxp')
+def _maxp_validator(data):
+    _need(data, 0, 6, 'maxp header')
+    (version,) = unpack('>i', data[:4])
+    if version >= 0x10000:
+        _need(data, 6, 26, 'maxp version 1.0 fields')
+    return _maxp_parser(data)
+
+@validates(b'name')
+def _name_validator(data):
+    _need(data, 0, 6, 'name header')
+    (format_, count, string_offset) = unpack('>3H', data[:6])
+    _need(data, 6, count*12, 'name records')
+    for i, (platform_id, platform_specific_id, language_id, name_id,
+            length, offset) in enumerate(iter_unpack('>6H', data[6:6+count*12])):
+        _need(data, string_offset + offset, length, f'name record {i} string')
+
+    if format_ == 1:
+        table_offset = 6 + count*12
+        _need(data, table_offset, 2, 'language tag count')
+        (lang_tag_count,) = unpack('>H', data[table_offset:table_offset+2])
+        table_offset += 2
+        _need(data, table_offset, lang_tag_count*4, 'language tag records')
+        for i, (length, offset) in enumerate(iter_unpack('>2H',
+                data[table_offset:table_offset+lang_tag_count*4])):
+            _need(data, string_offset + offset, length,
+                    f'language tag record {i} string')
+    return {}
+
+@validates(b'post')
+def _post_validator(data):
+    _need(data, 0, 32, 'post header')
+    (version,) = unpack('>i', data[:4])
+    if version != 0x20000:
+        return {}
+
+    _need(data, 32, 2, 'post glyph count')
+    (num_glyphs,) = unpack('>H', data[32:34])
+    _need(data, 34, num_glyphs*2, 'glyph name index')
+    offset = 34 + num_glyphs*2
+    num_names = 0
+    while offset < len(data):
+        _need(data, offset + 1, data[offset], f'glyph name string {num_names}')
+        offset += data[offset] + 1
+        num_names += 1
+    for glyph_id, (x,) in enumerate(iter_unpack('>H',
+            data[34:34+num_glyphs*2])):
+        if x >= 258 + num_names:
+            raise _Malformed(34 + glyph_id*2,
+                    f'glyph {glyph_id} refers to missing name {x}')
+    return {'num_glyphs': num_glyphs}
+
+@validates(b'OS/2')
+def _OS_2_validator(data):
+    _need(data, 0, 68, 'OS/2 table')
+    (version,) = unpack('>H', data[:2])
+    if version >= 5:
+        _need(data, 0, 100, f'OS/2 version {version} table')
+    elif version >= 2:
+        _need(data, 0, 96, f'OS/2 version {version} table')
+    elif version >= 1:
+        _need(data, 0, 86, f'OS/2 version {version} table')
+    return {}
+
+def _validate_glyph_counts(tables, facts, problems):
+    '''Check maxp.numGlyphs against the glyph-indexed tables'''
+    def problem(tag, offset, message):
+        problems.append({'table': tag.decode('latin-1'), 'offset': offset,
+                         'problem': message})
+
+    if 'num_glyphs' not in facts.get(b'maxp', {}):
+        return
+    num_glyphs = facts[b'maxp']['num_glyphs']
+
+    index_to_loc_format = facts.get(b'head', {}).get('index_to_loc_format')
+    if b'loca' in tables and index_to_loc_format is not None:
+        loca = tables[b'loca']
+        if index_to_loc_format == 0:
+            offsets = (x*2 for (x,) in iter_unpack('>H', loca[:len(loca)//2*2]))
+            entry_size = 2
+        else:
+            offsets = (x for (x,) in iter_unpack('>I', loca[:len(loca)//4*4]))
+            entry_size = 4
+        if len(loca) != (num_glyphs + 1) * entry_size:
+            problem(b'loca', 0, f'{len(loca)} bytes, expected'
+                    f' {(num_glyphs + 1) * entry_size} for {num_glyphs} glyphs')
+        else:
+            glyf_length = len(tables.get(b'glyf', b''))
+            previous = 0
+            for glyph_id, glyph_offset in enumerate(offsets):
+                if glyph_offset < previous or glyph_offset > glyf_length:
+                    problem(b'loca', glyph_id*entry_size,
+                            f'glyph {glyph_id} offset {glyph_offset} out of'
+                            f' order or past end of glyf ({glyf_length} bytes)')
+                    break
+                previous = glyph_offset
+
+    number_of_h_metrics = facts.get(b'hhea', {}).get('number_of_h_metrics')
+    if b'hmtx' in tables and number_of_h_metrics is not None:
+        if not 1 <= number_of_h_metrics <= num_glyphs:
+            problem(b'hhea', 34, f'{number_of_h_metrics} hMetrics for'
+                                 f' {num_glyphs} glyphs')
+        else:
+            expected = number_of_h_metrics*4 + (num_glyphs - number_of_h_metrics)*2
+            if len(tables[b'hmtx']) < expected:
+                problem(b'hmtx', 0, f'{len(tables[b"hmtx"])} bytes, expected'
+                                    f' {expected} for {num_glyphs} glyphs')
+
+    size_device_record = facts.get(b'hdmx', {}).get('size_device_record')
+    if size_device_record is not None and size_device_record < num_glyphs + 2:
+        problem(b'hdmx', 4, f'device records of {size_device_record} bytes'
+                            f' for {num_glyphs} glyphs')
+
+    ltsh_glyphs = facts.get(b'LTSH', {}).get('num_glyphs')
+    if ltsh_glyphs is not None and ltsh_glyphs != num_glyphs:
+        problem(b'LTSH', 2, f'{ltsh_glyphs} thresholds for {num_glyphs} glyphs')
+
+    post_glyphs = facts.get(b'post', {}).get('num_glyphs')
+    if post_glyphs is not None and post_glyphs != num_glyphs:
+        problem(b'post', 32, f'{post_glyphs} glyph names for {num_glyphs} glyphs')
+
+    if b'cmap' in facts:
+        cmap = tables[b'cmap']
+        subtables = _cmap_decode(cmap)
+        (num_tables,) = unpack('>H', cmap[2:4])
+        checked = set()
+        for i, (platform_id, platform_specific_id, offset) in enumerate(
+                iter_unpack('>2HI', cmap[4:4+num_tables*8])):
+            (format_, mapping) = subtables[(platform_id, platform_specific_id)]
+            if offset in checked or mapping is None:
+                continue
+            checked.add(offset)
+            if format_ == 14:
+                max_glyph = max((max(glyphs, default=0)
+                                 for (_, glyphs) in mapping[2]), default=0)
+            else:
+                (starts, ends, glyphs, steps) = mapping
+                max_glyph = max((glyphs[j] + steps[j]*(ends[j] - starts[j])
+                                 for j in range(len(starts))), default=0)
+            if max_glyph >= num_glyphs:
+                problem(b'cmap', 4 + i*8, f'encoding ({platform_id},'
+                        f'{platform_specific_id}) maps to glyph {max_glyph}'
+                        f' of {num_glyphs}')
+
+def validate_font(font):
+    '''Check the structure of a font held in memory, in a single pass
+
+    Returns a list of problems, each a dict with the table tag (None for the
+    table directory), an offset (into the table, or into the file for the
+    table directory) and a description.  Checking stops at the first problem
+    in the table directory, and at the first problem within each table.
+
+    '''
+    font = memoryview(font)
+    problems = []
+    def problem(tag, offset, message):
+        problems.append({'table': tag and tag.decode('latin-1'),
+                         'offset': offset, 'problem': message})
+
+    try:
+        _need(font, 0, 12, 'offset table')
+        (scaler_type, num_tables) = unpack('>IH', font[:6])
+        if scaler_type not in {0x00010000, 0x4F54544F, 0x74727565, 0x74797031}:
+            raise _Malformed(0, f'unknown scaler type 0x{scaler_type:08X}')
+        _need(font, 12, num_tables*16, 'table directory')
+    except _Malformed as e:
+        problem(None, e.offset, e.message)
+        return problems
+    directory = list(iter_unpack('>4sIII', font[12:12+num_tables*16]))
+
+    tables = {}
+    for i, (tag, checksum, offset, length) in enumerate(directory):
+        entry_offset = 12 + i*16
+        if tag in tables:
+            problem(None, entry_offset, f'duplicate table {tag}')
+        elif offset + length > len(font):
+            problem(None, entry_offset, f'table {tag} ({length} bytes at'
+                    f' {offset}) extends past end of file ({len(font)} bytes)')
+        elif offset % 4:
+            problem(None, entry_offset, f'table {tag} at {offset} is not'
+                                        f' 4-byte aligned')
+        tables[tag] = font[offset:offset+length]
+
+    previous_tag, previous_end = None, 0
+    for tag, checksum, offset, length in sorted(directory,
+            key=lambda entry: entry[2]):
+        if length == 0:
+            continue
+        if offset < previous_end:
+            problem(None, None, f'table {tag} at {offset} overlaps'
+                                f' table {previous_tag}')
+        if offset + length > previous_end:
+            previous_tag, previous_end = tag, offset + length
+
+    for tag in (b'cmap', b'head', b'hhea', b'hmtx', b'maxp', b'name', b'post'):
+        if tag not in tables:
+            problem(None, None, f'required table {tag} is missing')
+    if problems:
+        return problems
+
+    facts = {}
+    for tag, checksum, offset, length in directory:
+        data = tables[tag]
+        if not _verify_checksum(tag, data, checksum):
+            problem(tag, None, f'checksum mismatch, directory has'
+                               f' 0x{checksum:08X}')
+        if tag in _validators:
+            try:
+                facts[tag] = _validators[tag](data)
+            except _Malformed as e:
+                problem(tag, e.offset, e.message)
+
+    _validate_glyph_counts(tables, facts, problems)
+    return problems
+
+
 if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == '-d':
+        if len(sys.argv) < 4:
+            print(f'Usage: {sys.argv[0]} -d old.ttf new.ttf')
+            exit()
+        diff_fonts(sys.argv[2], sys.argv[3])
+        exit()
+
+    if len(sys.argv) >= 2 and sys.argv[1] == '-g':
+        if len(sys.argv) < 3:
+            print(f'Usage: {sys.argv[0]} -g font.ttf...')
+            exit()
+        _print_corpus(*fingerprint_corpus(sys.argv[2:]))
+        exit()
+
+    if len(sys.argv) >= 2 and sys.argv[1] == '-c':
+        if len(sys.argv) < 3:
+            print(f'Usage: {sys.argv[0]} -c font.ttf...')
+            exit()
+        valid = True
+        for path in sys.argv[2:]:
+            try:
+                with open(path, 'rb') as f:
+                    problems = validate_font(f.read())
+            except OSError as e:
+                problems = [{'table': None, 'offset': None, 'problem': str(e)}]
+            print(json.dumps({'font': path, 'problems': problems}))
+            valid = valid and not problems
+        exit(0 if valid else 1)
+
     if len(sys.argv) >= 2 and sys.argv[1] == '-v':
         verbose = True
         sys.argv.pop(1)
 
     if len(sys.argv) < 2:
         print(f'Usage: {sys.argv[0]} [-v] font.ttf')
+        print(f'       {sys.argv[0]} -d old.ttf new.ttf')
+        print(f'       {sys.argv[0]} -c font.ttf...')
+        print(f'       {sys.argv[0]} -g font.ttf...')
         exit()
 
     with open(sys.argv[1], 'rb') as f:
-        (scaler_type, num_tables, search_range, entry_selector,
-                range_shift) = unpack('>IHHHH', f.read(12))
-        tables = []
-        for _ in range(num_tables):
-            tables.append(unpack('>4sIII', f.read(16)))
+        tables = _read_table_directory(f)
 
         for tag, checksum, offset, length in tables:
             if tag in _handlers:
                 f.seek(offset)
                 data = f.read(length)
-                _verify_checksum(data, checksum)
+                if not _verify_checksum(tag, data, checksum):
+                    print(f'WARNING: {tag} checksum 0x{checksum:08X} does not'
+                          f' match table data')
                 _handlers[tag](data)
             else:
                 print(f'Table {tag} has no handler. Ignoring.')